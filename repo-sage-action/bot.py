@@ -4,16 +4,24 @@ import yaml
 import base64
 import re
 import argparse
-from github import Github
+from github import Auth, Github, GithubException, InputGitTreeElement
+from github.GitTreeElement import GitTreeElement
 import requests
+import orjson
 import json
 from datetime import datetime
 from pathlib import Path
 import logging
 import concurrent.futures
+import hashlib
 from typing import List, Dict, Any, Optional
 import tempfile
+import shutil
 import subprocess
+import threading
+import time
+import random
+from collections import Counter, deque
 
 # Configure logging
 logging.basicConfig(
@@ -24,13 +32,529 @@ logger = logging.getLogger('RepoSage')
 
 # Constants
 SUPPORTED_FILE_EXTENSIONS = ('.py', '.js', '.java', '.ts', '.jsx', '.tsx', '.html', '.css', '.md', '.yml', '.yaml')
+SUPPORTED_EXTENSION_SET = frozenset(SUPPORTED_FILE_EXTENSIONS)  # For one hash lookup per path
+# Language named on the code fence around a file in the prompt
+LANGUAGE_HINTS = {
+    '.py': 'python', '.js': 'javascript', '.java': 'java', '.ts': 'typescript',
+    '.jsx': 'jsx', '.tsx': 'tsx', '.html': 'html', '.css': 'css',
+    '.md': 'markdown', '.yml': 'yaml', '.yaml': 'yaml'
+}
 IGNORED_DIRECTORIES = ('node_modules', 'venv', '.git', '__pycache__', 'dist', 'build')
 MAX_FILE_SIZE = 100 * 1024  # 100 KB
 MAX_TOKENS = 4096
 DEFAULT_MODEL = "qwen/qwq-32b:free"
+GITHUB_API_URL = "https://api.github.com"
+GITHUB_POOL_SIZE = 20  # Keep-alive connections shared by all GitHub calls
+MAX_PR_WORKERS = 8  # Individual pull requests created concurrently
+MAX_PR_BODY_CHARS = 65536  # GitHub rejects longer pull request bodies
+OPENROUTER_POOL_SIZE = 16  # Keep-alive connections shared by all OpenRouter calls
+OPENROUTER_MAX_RETRIES = 3  # Retries of a rate-limited (429) or failed (5xx) OpenRouter call
+MAX_BATCH_BYTES = 30 * 1024  # Default combined size of the files packed into one request
+BLOB_FILE_MODE = "100644"  # Git mode for new files; existing files keep their own
+DEPENDENCY_MANIFESTS = ('requirements.txt', 'pyproject.toml', 'package.json')
+DEFAULT_CHANGELOG = """# Changelog
+
+All notable changes to this project will be documented in this file.
+
+The format is based on [Keep a Changelog](https://keepachangelog.com/en/1.0.0/),
+and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0.html).
+
+## [Unreleased]
+
+### Added
+
+### Changed
+
+### Fixed
+
+"""
+
+# Prompt prefixes are kept byte-identical across calls so providers can cache them
+SYSTEM_PROMPT = "You are RepoSage, an expert code analyzer that suggests concrete improvements to codebases, including your own. Always include tests for any changes you suggest, and consider how you could improve your own code. Each change you suggest should build upon previous improvements documented in the project's changelog."
+ANALYSIS_INSTRUCTIONS = """You are RepoSage, an AI assistant specialized in code analysis and self-improvement.
+
+You are designed to analyze codebases (including your own code) and suggest concrete improvements with tests.
+As a self-improving system, you can and should suggest changes to improve your own codebase.
+
+Analyze the file given at the end of this message and suggest specific improvements.
+
+Provide your analysis in the following JSON format:
+{
+  "analysis": {
+    "code_quality": "Detailed analysis of code quality issues",
+    "best_practices": "Analysis of adherence to best practices",
+    "potential_bugs": "Identification of potential bugs or edge cases",
+    "performance": "Performance improvement suggestions"
+  },
+  "suggested_changes": [
+    {
+      "original_code": "Exact code snippet to be replaced",
+      "line_range": [1, 3],
+      "improved_code": "Improved code replacement",
+      "explanation": "Explanation of why this change improves the code",
+      "test_code": "Unit test code that validates this change works correctly" 
+    }
+  ],
+  "summary": "A concise summary of the main improvements suggested"
+}
+
+IMPORTANT GUIDELINES:
+1. Make sure your suggestions are concrete, specific, and would genuinely improve the codebase.
+2. Focus on the most impactful changes.
+3. For EACH suggested change, you MUST include test code that validates the change works correctly.
+4. The tests should be comprehensive and follow best practices for the language.
+5. If modifying existing functionality, ensure tests verify the functionality still works as expected.
+6. If this is your own code, consider how you could improve yourself to be more effective.
+7. Review the changelog to ensure your suggestions build upon previous improvements and don't conflict with them.
+8. Set "line_range" to the first and last line numbers (1-based, inclusive) of the original code in the file.
+"""
+BATCH_INSTRUCTIONS = """Several files are given below, each introduced by a "=== FILE n: path ===" line. Analyze each file separately and reply with a single JSON object of the form {"results": [...]} holding one entry per file. Each entry has a "file_path" key set to the file's path, plus the "analysis", "suggested_changes" and "summary" keys of the format above."""
+
+# Digest of the prompts, so cached analyses are dropped whenever the prompts change
+PROMPT_VERSION = hashlib.sha256(f"{SYSTEM_PROMPT}\0{ANALYSIS_INSTRUCTIONS}\0{BATCH_INSTRUCTIONS}".encode('utf-8')).hexdigest()[:12]
+
+# Characters that open, close or escape JSON objects and strings, used to pull
+# the JSON analysis out of a model response
+JSON_STRUCTURE_PATTERN = re.compile(r'[{}"\\]')
+# Where a JSON object with string keys may start, tried when the brace scan
+# was thrown off by braces and quotes in the surrounding prose
+JSON_OBJECT_START_PATTERN = re.compile(r'\{\s*"')
+UNRELEASED_SECTION_PATTERN = re.compile(r"## \[Unreleased\].*?(?=##|\Z)", re.DOTALL)
+# Matches paths inside an ignored directory at any depth
+IGNORED_PATH_PATTERN = re.compile(r'(?:^|/)(?:' + '|'.join(map(re.escape, IGNORED_DIRECTORIES)) + r')/')
+BACKTICK_RUN_PATTERN = re.compile(r'`+')
+NEWLINE_PATTERN = re.compile(r'\n')
+# Changelog keywords; a "fixed" keyword anywhere wins over an "added" one
+CHANGELOG_CATEGORY_PATTERN = re.compile(
+    r"(?P<fixed>fix|bug|issue|error|crash)|(?P<added>add|new|implement|create)",
+    re.IGNORECASE
+)
+
+def _is_supported_file(path):
+    """Return True if the path has one of the supported file extensions."""
+    return os.path.splitext(path)[1] in SUPPORTED_EXTENSION_SET
+
+def _language_hint(path):
+    """Return the code fence language for a file, or an empty string."""
+    return LANGUAGE_HINTS.get(os.path.splitext(path)[1], '')
+
+def _categorize_explanation(explanation):
+    """Pick the changelog section (fixed, added or changed) for a change explanation."""
+    category = "changed"
+    for match in CHANGELOG_CATEGORY_PATTERN.finditer(explanation):
+        if match.lastgroup == "fixed":
+            return "fixed"
+        category = "added"
+    return category
+
+def _line_range_span(content, line_offsets, line_range, original):
+    """Locate original within a 1-based, inclusive line range of content.
+    
+    Returns:
+        (start, end) character offsets of the snippet, or None if the range is
+        invalid or does not contain the snippet
+    """
+    try:
+        start_line, end_line = (int(line) for line in line_range)
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= start_line <= end_line < len(line_offsets):
+        return None
+    
+    index = content.find(original, line_offsets[start_line - 1], line_offsets[end_line])
+    if index == -1:
+        return None
+    return index, index + len(original)
+
+def _whitespace_tolerant_pattern(original):
+    """Compile a pattern matching original with any amount of whitespace between its tokens.
+    
+    A match starts at the snippet's first token, leaving the file's
+    indentation in place. Trailing whitespace in the snippet only matches
+    spaces and at most one line break, so a match does not swallow
+    neighbouring lines.
+    """
+    body = r'\s+'.join(re.escape(token) for token in original.split())
+    trailing_space = original[len(original.rstrip()):]
+    suffix = ''
+    if trailing_space:
+        suffix = r'[ \t]*\n?' if '\n' in trailing_space else r'[ \t]*'
+    return re.compile(body + suffix)
+
+def _reindent(improved, original, content, start):
+    """Shift improved code from the snippet's indentation to that of the file at start.
+    
+    The leading whitespace of improved is dropped, since the file's own
+    indentation stays in front of the match. Lines that are not indented at
+    least as deeply as the snippet's first line are left as they are.
+    """
+    line_start = content.rfind('\n', 0, start) + 1
+    file_indent = content[line_start:start]
+    first_line = original.lstrip('\r\n')
+    snippet_indent = first_line[:len(first_line) - len(first_line.lstrip(' \t'))]
+    improved = improved.lstrip()
+    if file_indent.strip() or file_indent == snippet_indent:
+        return improved
+    
+    lines = improved.splitlines(keepends=True)
+    for index, line in enumerate(lines[1:], 1):
+        if line.strip() and line.startswith(snippet_indent):
+            lines[index] = file_indent + line[len(snippet_indent):]
+    return "".join(lines)
+
+def _apply_changes(content, suggested_changes):
+    """Replace each suggestion's original code with its improved code.
+    
+    A suggestion with a "line_range" replaces its snippet inside those lines
+    only; the others replace every occurrence of their snippet, trying longer
+    snippets first where they overlap, or failing that every occurrence that
+    differs only in whitespace. All edits are located in the original content
+    and applied in one pass; an edit overlapping an earlier one is skipped.
+    
+    Returns:
+        Tuple of (new content, number of suggestions that were applied)
+    """
+    line_offsets = None
+    edits = []  # (start, end, improved code, suggestion key)
+    replacements = {}
+    for index, change in enumerate(suggested_changes):
+        original = change.get('original_code')
+        if not original or 'improved_code' not in change:
+            continue
+        
+        if change.get('line_range') is not None:
+            if line_offsets is None:
+                line_offsets = [0] + [match.end() for match in NEWLINE_PATTERN.finditer(content)] + [len(content)]
+            span = _line_range_span(content, line_offsets, change['line_range'], original)
+            if span:
+                edits.append((span[0], span[1], change['improved_code'], index))
+                continue
+        replacements.setdefault(original, change['improved_code'])
+    
+    # Edits located by line range take precedence over plain matches
+    edits.sort()
+    kept = []
+    for edit in edits:
+        if not kept or edit[0] >= kept[-1][1]:
+            kept.append(edit)
+    
+    if replacements:
+        ranged = list(kept)
+        pattern = re.compile('|'.join(re.escape(original) for original in sorted(replacements, key=len, reverse=True)))
+        for match in pattern.finditer(content):
+            if not any(match.start() < end and start < match.end() for start, end, _, _ in ranged):
+                kept.append((match.start(), match.end(), replacements[match.group(0)], match.group(0)))
+        
+        # Snippets with no exact match may differ from the file only in whitespace
+        matched = {key for _, _, _, key in kept}
+        for original, improved in replacements.items():
+            if original in matched or not original.split():
+                continue
+            taken = list(kept)
+            for match in _whitespace_tolerant_pattern(original).finditer(content):
+                if not any(match.start() < end and start < match.end() for start, end, _, _ in taken):
+                    kept.append((match.start(), match.end(), _reindent(improved, original, content, match.start()), original))
+        kept.sort(key=lambda edit: edit[0])
+    
+    if not kept:
+        return content, 0
+    
+    parts = []
+    position = 0
+    for start, end, improved, _ in kept:
+        parts.append(content[position:start])
+        parts.append(improved)
+        position = end
+    parts.append(content[position:])
+    return "".join(parts), len({key for _, _, _, key in kept})
+
+def _pack_batches(files, max_batch_bytes):
+    """Group files into as few batches as possible whose sizes add up to at most max_batch_bytes.
+    
+    Files are placed largest first, each into the first batch with room for
+    it (first-fit decreasing), so small files fill the space left beside
+    larger ones. A file larger than the budget gets a batch of its own.
+    """
+    batches = []
+    batch_sizes = []
+    for file_content in sorted(files, key=lambda f: f.size, reverse=True):
+        for index, batch_bytes in enumerate(batch_sizes):
+            if batch_bytes + file_content.size <= max_batch_bytes:
+                batches[index].append(file_content)
+                batch_sizes[index] += file_content.size
+                break
+        else:
+            batches.append([file_content])
+            batch_sizes.append(file_content.size)
+    return batches
+
+def _json_objects(text):
+    """Yield each balanced top-level {...} span of text.
+    
+    The text is scanned once, jumping between braces, quotes and backslashes;
+    braces inside JSON strings are skipped. The objects found inside a brace
+    that is never closed are yielded once the scan reaches the end.
+    """
+    open_braces = []  # (start, (start, end) of each balanced object directly inside it)
+    in_string = False
+    escaped_until = -1
+    for match in JSON_STRUCTURE_PATTERN.finditer(text):
+        index = match.start()
+        if index < escaped_until:
+            continue
+        char = match.group(0)
+        if in_string:
+            if char == '\\':
+                escaped_until = index + 2
+            elif char == '"':
+                in_string = False
+        elif char == '{':
+            open_braces.append((index, []))
+        elif not open_braces:
+            continue
+        elif char == '"':
+            in_string = True
+        elif char == '}':
+            start, _ = open_braces.pop()
+            if open_braces:
+                open_braces[-1][1].append((start, index + 1))
+            else:
+                yield text[start:index + 1]
+    
+    for start, end in sorted(span for _, spans in open_braces for span in spans):
+        yield text[start:end]
+
+def _find_json_object(text, key):
+    """Return the first JSON object in a model response that has key, or None.
+    
+    The whole response is tried first, then each object embedded in it, such
+    as one inside a Markdown code block or after an introduction. Prose with
+    stray braces or quotes can throw the brace scan off, so failing that, an
+    object is decoded from each place one could start.
+    """
+    def parse(candidate):
+        try:
+            parsed = orjson.loads(candidate)
+        except orjson.JSONDecodeError:
+            return None
+        return parsed if isinstance(parsed, dict) and key in parsed else None
+    
+    parsed = parse(text)
+    if parsed is not None:
+        return parsed
+    for candidate in _json_objects(text):
+        parsed = parse(candidate)
+        if parsed is not None:
+            return parsed
+    
+    decoder = json.JSONDecoder()
+    for match in JSON_OBJECT_START_PATTERN.finditer(text):
+        try:
+            parsed, _ = decoder.raw_decode(text, match.start())
+        except ValueError:
+            continue
+        if isinstance(parsed, dict) and key in parsed:
+            return parsed
+    return None
+
+def _parse_batch_response(analysis_text):
+    """Return the per-file entries of a batched analysis response, or an empty list."""
+    parsed = _find_json_object(analysis_text, 'results')
+    if parsed is not None and isinstance(parsed['results'], list):
+        return parsed['results']
+    return []
+
+def _retry_delay(response, attempt):
+    """Seconds to wait before retrying a failed request.
+    
+    Uses the Retry-After header when the server sent one, otherwise an
+    exponential backoff; either way with a little jitter so that threads
+    rejected together do not retry together.
+    """
+    try:
+        delay = float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        delay = 2 ** attempt
+    return delay + random.uniform(0, 0.1 * delay + 0.1)
+
+def _code_fence(text):
+    """Return a Markdown code fence that cannot be closed by anything inside text."""
+    longest_run = max((len(match.group(0)) for match in BACKTICK_RUN_PATTERN.finditer(text)), default=0)
+    return '`' * max(longest_run + 1, 3)
+
+def _decode_content(file_content, errors='strict'):
+    """Decode the base64 payload of a GitHub content object to text."""
+    return base64.b64decode(file_content.content).decode('utf-8', errors)
+
+class AnalysisCache:
+    """Persistent record of file analyses from previous runs.
+    
+    Entries are keyed by the prompt version, the model, a digest of the
+    dependency manifests that govern the file and the file's blob SHA, so a
+    file is only analyzed again when its content, its dependencies, the model
+    or the prompts change. Only settled analyses are recorded: those with
+    nothing to change and those whose changes were committed.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else None
+        self._entries = {}
+        self._lock = threading.Lock()
+        
+        if self.path and self.path.exists():
+            try:
+                with open(self.path, 'rb') as f:
+                    self._entries = orjson.loads(f.read())
+                logger.info(f"Loaded {len(self._entries)} cached analyses from {self.path}")
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable analysis cache {self.path}: {str(e)}")
+
+    @staticmethod
+    def key(sha, model, dependency_key=""):
+        """Build the cache key for a file blob analyzed with a model."""
+        return f"{PROMPT_VERSION}\0{model}\0{dependency_key}\0{sha}"
+
+    def is_stale(self, sha, model, dependency_key=""):
+        """Return True if the blob has not been analyzed with this model and dependencies."""
+        return self.key(sha, model, dependency_key) not in self._entries
+
+    def record(self, sha, model, analysis, dependency_key=""):
+        """Remember the analysis of a file blob."""
+        with self._lock:
+            self._entries[self.key(sha, model, dependency_key)] = analysis
+
+    def save(self):
+        """Write the cache to disk if it is backed by a file.
+        
+        Returns:
+            True if the cache was written, False otherwise
+        """
+        if not self.path:
+            return False
+        try:
+            with self._lock, open(self.path, 'wb') as f:
+                f.write(orjson.dumps(self._entries))
+            logger.info(f"Saved {len(self._entries)} cached analyses to {self.path}")
+            return True
+        except OSError as e:
+            logger.error(f"Error saving analysis cache: {str(e)}")
+            return False
+
+class RateLimiter:
+    """Spaces calls evenly so they stay under a requests-per-minute limit.
+    
+    Each acquire() reserves the next free slot and sleeps until it, so worker
+    threads are released at a steady rate instead of bursting into the limit.
+    Without a limit calls go straight through, except after a pause().
+    """
+
+    def __init__(self, requests_per_minute=None):
+        self.interval = 60.0 / requests_per_minute if requests_per_minute else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def pause(self, seconds):
+        """Hold back every caller for the given time, e.g. after a rate-limit response."""
+        with self._lock:
+            self._next_slot = max(self._next_slot, time.monotonic() + seconds)
+
+    def acquire(self):
+        """Block until the caller may make its next request."""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class GitBlobReader:
+    """Reads blobs from a shallow clone through one `git cat-file --batch` process.
+    
+    The clone downloads every blob of the branch tip in a single pack, and the
+    long-lived process answers each lookup over a pipe, instead of one Git blob
+    API request per file.
+    """
+
+    def __init__(self, clone_url, branch, token=None):
+        self.workdir = tempfile.mkdtemp(prefix="reposage-clone-")
+        clone_process = subprocess.run(
+            ["git", "clone", clone_url, "--branch", branch, "--depth", "1",
+             "--single-branch", "--no-checkout", self.workdir],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            env=self._auth_env(token)
+        )
+        if clone_process.returncode != 0:
+            shutil.rmtree(self.workdir, ignore_errors=True)
+            stderr = clone_process.stderr.replace(token, "******") if token else clone_process.stderr
+            raise RuntimeError(f"Failed to clone repository: {stderr}")
+        
+        self._process = subprocess.Popen(
+            ["git", "-C", self.workdir, "cat-file", "--batch"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _auth_env(token):
+        """Return the environment for the clone, sending token as an HTTP header.
+        
+        Passing the token through git's environment config keeps it out of the
+        command line and out of the clone's .git/config.
+        """
+        if not token:
+            return None
+        env = dict(os.environ)
+        index = int(env.get("GIT_CONFIG_COUNT") or 0)
+        credentials = base64.b64encode(f"x-access-token:{token}".encode()).decode()
+        env.update({
+            "GIT_CONFIG_COUNT": str(index + 1),
+            f"GIT_CONFIG_KEY_{index}": "http.extraHeader",
+            f"GIT_CONFIG_VALUE_{index}": f"Authorization: Basic {credentials}",
+        })
+        return env
+
+    def read(self, sha):
+        """Return the bytes of a blob, or None if the clone does not contain it.
+        
+        Raises:
+            OSError: If the cat-file process has died or sent a truncated blob
+        """
+        with self._lock:
+            try:
+                self._process.stdin.write(f"{sha}\n".encode())
+                self._process.stdin.flush()
+                # "<sha> <type> <size>", or "<sha> missing"
+                header = self._process.stdout.readline().split()
+                if not header:
+                    raise OSError("git cat-file exited")
+                if len(header) != 3:
+                    return None
+                # The object is followed by a newline
+                size = int(header[2])
+                data = self._process.stdout.read(size + 1)
+            except ValueError as e:
+                raise OSError(f"Unreadable git cat-file output: {str(e)}") from e
+        if len(data) != size + 1:
+            raise OSError(f"git cat-file sent {len(data)} of {size + 1} bytes for {sha}")
+        return data[:-1]
+
+    def close(self):
+        """Stop the cat-file process and remove the clone."""
+        try:
+            self._process.stdin.close()
+        except OSError:
+            # The process already exited, leaving unsent input behind
+            pass
+        self._process.wait()
+        shutil.rmtree(self.workdir, ignore_errors=True)
 
 class RepoSage:
-    def __init__(self, github_token, repo_name, openrouter_api_key, model=DEFAULT_MODEL, base_branch='main', description=None, use_parallel=True):
+    _COMMIT_HEADER = "RepoSage: AI-suggested improvements\n\nChanges to "
+
+    def __init__(self, github_token, repo_name, openrouter_api_key, model=DEFAULT_MODEL, base_branch='main', description=None, use_parallel=True, cache_file=None, batch_bytes=0, stream_responses=False, requests_per_minute=None, local_clone=False):
         self.github_token = github_token
         self.repo_name = repo_name
         self.openrouter_api_key = openrouter_api_key
@@ -38,6 +562,11 @@ class RepoSage:
         self.base_branch = base_branch
         self.description = description
         self.use_parallel = use_parallel
+        self.batch_bytes = batch_bytes
+        self.stream_responses = stream_responses
+        self._rate_limiter = RateLimiter(requests_per_minute)
+        self.local_clone = local_clone
+        self._blob_reader = None
 
         # log the first 5 characters of the github token
         logger.info(f"Initialized RepoSage for repository: {self.repo_name} with github token: {self.github_token[:5]}******")
@@ -49,177 +578,274 @@ class RepoSage:
             raise ValueError("Missing required environment variables. Please ensure GITHUB_TOKEN, GITHUB_REPOSITORY, and OPENROUTER_API_KEY are set.")
         
         # Initialize GitHub client
-        self.github = Github(self.github_token)
+        # A single client (and connection pool) is shared by every GitHub call,
+        # so worker threads reuse keep-alive connections instead of new handshakes
+        self.github = Github(auth=Auth.Token(self.github_token), pool_size=GITHUB_POOL_SIZE)
         self.repo = self.github.get_repo(self.repo_name)
         
+        # File contents are downloaded as raw bytes rather than base64 JSON,
+        # which PyGithub does not support, through a session of their own
+        self.github_http = requests.Session()
+        self.github_http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=GITHUB_POOL_SIZE))
+        self.github_http.headers.update({
+            "Authorization": f"token {self.github_token}",
+            "Accept": "application/vnd.github.raw"
+        })
+        
+        # Likewise one HTTP session is shared by every OpenRouter call
+        self.http = requests.Session()
+        self.http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=OPENROUTER_POOL_SIZE))
+        self.http.headers.update({
+            "Authorization": f"Bearer {self.openrouter_api_key}",
+            "Content-Type": "application/json",
+            # Identifies the app to OpenRouter, which attributes and routes its requests by it
+            "X-Title": "RepoSage"
+        })
+        
         # Generate a unique branch name with timestamp
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
         self.branch_name = f"reposage-improvements-{timestamp}"
         
+        # Run mode; run() overrides these for each invocation
+        self.dry_run = False
+        self.direct_commit = True
+        
+        # Pending creation of the feature branch, awaited before anything is written to it
+        self._branch_future = None
+        
+        # Canned (success, output) result returned by run_tests, used by tests
+        self.mock_test_run = None
+        
+        # Working tree reused by every run_tests call, cloned on first use,
+        # and the test command detected in it
+        self._test_dir = None
+        self._test_command = None
+        
+        # The changelog is read once per run and shared by every file analysis
+        self._changelog_content = None
+        self._changelog_lock = threading.Lock()
+        
+        # Analyses from previous runs, and the dependency manifests and file
+        # modes seen while listing files
+        self._cache = AnalysisCache(cache_file)
+        self._manifest_shas = {}
+        self._file_modes = {}
+        
+        # Base branch commit the files were listed from, shared by every new branch
+        self._base_commit_sha = None
+        
+        # Files fetched from GitHub, keyed by (path, ref) and revalidated by ETag
+        self._contents_cache = {}
+        self._contents_lock = threading.Lock()
+        
         logger.info(f"Initialized RepoSage for repository: {self.repo_name}")
 
     def fetch_repo_files(self):
-        """Fetch all relevant files from the repository."""
+        """Fetch all relevant files from the repository.
+        
+        Only file metadata is listed here; contents are fetched lazily when a
+        file is analyzed.
+        """
         logger.info("Fetching repository files...")
-        contents = self.repo.get_contents("")
         files = []
         
-        while contents:
-            file_content = contents.pop(0)
-            path = file_content.path
-            
-            # Skip ignored directories
-            if any(ignored_dir in path for ignored_dir in IGNORED_DIRECTORIES):
-                continue
-                
-            if file_content.type == "dir":
-                contents.extend(self.repo.get_contents(path))
-            elif file_content.type == "file":
-                # Filter by file extension and size
-                if path.endswith(SUPPORTED_FILE_EXTENSIONS) and file_content.size <= MAX_FILE_SIZE:
-                    files.append(file_content)
-                elif file_content.size > MAX_FILE_SIZE:
-                    logger.info(f"Skipping file {path} due to size limit")
-
+        for element in self._list_tree():
+            path = element.path
+            # Remember each file's mode so commits keep executable bits
+            self._file_modes[path] = element.mode
+            
+            # Remember dependency manifests so cached analyses can be invalidated
+            if path.rpartition('/')[2] in DEPENDENCY_MANIFESTS:
+                self._manifest_shas[path] = element.sha
+            
+            # Filter by file extension and size
+            if _is_supported_file(path) and element.size <= MAX_FILE_SIZE:
+                files.append(element)
+            elif element.size > MAX_FILE_SIZE:
+                logger.info(f"Skipping file {path} due to size limit")
         
         logger.info(f"Found {len(files)} relevant files for analysis")
         return files
 
+    def _list_tree(self):
+        """List every file of the base branch outside ignored directories.
+        
+        A single recursive Git Trees API call returns the whole repository,
+        instead of one contents request per directory. The tree is read from
+        the branch's head commit, which is kept so that branches created later
+        start from the same snapshot the files were analyzed at.
+        
+        Returns:
+            List of GitTreeElement objects carrying path, sha and size
+        """
+        commit = self.repo.get_branch(self.base_branch).commit
+        self._base_commit_sha = commit.sha
+        tree = self.repo.get_git_tree(commit.commit.tree.sha, recursive=True)
+        elements = tree.tree
+        if tree.truncated:
+            logger.warning(f"Tree of {self.base_branch} exceeds the Git Trees API limit; listing it directory by directory")
+            elements = self._walk_tree(commit.commit.tree.sha)
+        
+        if self.local_clone and self._blob_reader is None:
+            try:
+                self._blob_reader = GitBlobReader(f"https://github.com/{self.repo_name}.git", self.base_branch, token=self.github_token)
+            except Exception as e:
+                logger.warning(f"Reading blobs through the API instead of a local clone: {str(e)}")
+        return [
+            element for element in elements
+            if element.type == "blob"
+            and not IGNORED_PATH_PATTERN.search(element.path)
+        ]
+
+    def _walk_tree(self, tree_sha):
+        """List every file below a tree one directory at a time.
+        
+        Used when a recursive listing is truncated. Directories are visited
+        breadth-first and ignored directories are not descended into.
+        
+        Returns:
+            List of GitTreeElement objects whose paths are relative to the tree
+        """
+        elements = []
+        pending = deque([("", tree_sha)])
+        while pending:
+            prefix, sha = pending.popleft()
+            for element in self.repo.get_git_tree(sha).tree:
+                path = prefix + element.path
+                if element.type == "tree":
+                    if not IGNORED_PATH_PATTERN.search(path + "/"):
+                        pending.append((path + "/", element.sha))
+                elif prefix:
+                    # Entries of a subdirectory carry their name only
+                    elements.append(GitTreeElement(self.github.requester, {}, dict(element.raw_data, path=path)))
+                else:
+                    elements.append(element)
+        return elements
+
+    def _get_contents(self, path, ref):
+        """Fetch a file from the repository, reusing an earlier copy if unchanged.
+        
+        A file fetched before is revalidated with a conditional request on its
+        ETag: a 304 Not Modified reply skips the download and does not count
+        against the rate limit, while a changed file is refreshed in place.
+        
+        Args:
+            path: Path of the file in the repository
+            ref: Branch, tag or commit to read the file from
+            
+        Returns:
+            The ContentFile for the path
+        """
+        key = (path, ref)
+        with self._contents_lock:
+            cached = self._contents_cache.get(key)
+        
+        if cached is not None:
+            try:
+                cached.update()
+                return cached
+            except Exception:
+                with self._contents_lock:
+                    self._contents_cache.pop(key, None)
+                raise
+        
+        file_content = self.repo.get_contents(path, ref=ref)
+        with self._contents_lock:
+            self._contents_cache[key] = file_content
+        return file_content
+
+    def _read_blob(self, file_content):
+        """Return the raw bytes of a file.
+        
+        Tree entries only carry metadata, so their blob is read on demand, from
+        the local clone when there is one and otherwise downloaded raw from the
+        API; anything else (such as a ContentFile) already has its content. A
+        clone whose cat-file process has died is dropped for the API.
+        """
+        if isinstance(file_content, GitTreeElement):
+            blob_reader = self._blob_reader
+            if blob_reader is not None:
+                try:
+                    data = blob_reader.read(file_content.sha)
+                except OSError as e:
+                    # Every later read would fail too, so the API serves the rest
+                    logger.warning(f"Reading blobs through the API instead of the local clone: {str(e)}")
+                    self._blob_reader = None
+                    blob_reader.close()
+                    data = None
+                if data is not None:
+                    return data
+            response = self.github_http.get(f"{GITHUB_API_URL}/repos/{self.repo_name}/git/blobs/{file_content.sha}")
+            response.raise_for_status()
+            return response.content
+        return base64.b64decode(file_content.content)
+
+    def _analysis_prefix(self):
+        """Return the prompt parts shared by every analysis call.
+        
+        These are the analysis instructions followed by the changelog, if one
+        can be read, so they can be sent as a cacheable prefix.
+        """
+        cached_prefix = [ANALYSIS_INSTRUCTIONS]
+        
+        # Get changelog content for context
+        try:
+            changelog_content = self.read_changelog()
+            logger.info("Including changelog in analysis context")
+        except Exception as e:
+            changelog_content = ""
+            logger.warning(f"Could not read changelog for context: {str(e)}")
+        
+        if changelog_content:
+            cached_prefix.append("## Project Changelog and Development History\n\nBelow is the project's changelog showing previous changes and improvements. Use this as context when suggesting new improvements to ensure they build upon previous work.\n\n" + changelog_content)
+        return cached_prefix
+
     def analyze_file(self, file_content):
         """Analyze a file using OpenRouter API and suggest improvements."""
         try:
             file_path = file_content.path
-            file_ext = Path(file_path).suffix
             
-            # Safely decode the file content
+            # Safely decode the file content, replacing problematic characters
+            data = self._read_blob(file_content)
             try:
-                file_content_str = base64.b64decode(file_content.content).decode('utf-8')
+                file_content_str = data.decode('utf-8')
+                # Hand the downloaded content on so implement_changes need not fetch it again
+                source = {'original_content': file_content_str, 'content_sha': file_content.sha}
             except UnicodeDecodeError:
-                # Try with error handling for problematic characters
-                file_content_str = base64.b64decode(file_content.content).decode('utf-8', errors='replace')
+                file_content_str = data.decode('utf-8', 'replace')
+                source = {}
             
             logger.info(f"Analyzing file: {file_path}")
             
-            # Sanitize file content to avoid issues with special characters
-            # This helps prevent unterminated string errors
-            sanitized_content = json.dumps(file_content_str)[1:-1]  # Remove outer quotes from JSON string
-            
-            # Get changelog content for context
-            try:
-                changelog_content = self.read_changelog()
-                logger.info("Including changelog in analysis context")
-            except Exception as e:
-                changelog_content = ""
-                logger.warning(f"Could not read changelog for context: {str(e)}")
-            
-            # Prepare changelog section if available
-            changelog_section = ""
-            if changelog_content:
-                changelog_section = "## Project Changelog and Development History\n\nBelow is the project's changelog showing previous changes and improvements. Use this as context when suggesting new improvements to ensure they build upon previous work.\n\n" + changelog_content
+            # The content is sent verbatim inside a fence longer than any backtick run it contains
+            fence = _code_fence(file_content_str)
             
-            # Prepare the prompt for the AI model
-            prompt = f"""You are RepoSage, an AI assistant specialized in code analysis and self-improvement.
-
-You are designed to analyze codebases (including your own code) and suggest concrete improvements with tests.
-As a self-improving system, you can and should suggest changes to improve your own codebase.
-
-Analyze the following file and suggest specific improvements. The file is: {file_path}
-
-File content:
-```{file_ext}
-{sanitized_content}
-```
+            # Prepare the prompt for the AI model; the instructions and the
+            # changelog are shared by every file, so they go first to be cached
+            prompt = f"""The file is: {file_path}
 
 {f'Focus on the following aspects: {self.description}' if self.description else ''}
 
-{changelog_section}
-
-Provide your analysis in the following JSON format:
-{{
-  "analysis": {{
-    "code_quality": "Detailed analysis of code quality issues",
-    "best_practices": "Analysis of adherence to best practices",
-    "potential_bugs": "Identification of potential bugs or edge cases",
-    "performance": "Performance improvement suggestions"
-  }},
-  "suggested_changes": [
-    {{
-      "original_code": "Exact code snippet to be replaced",
-      "improved_code": "Improved code replacement",
-      "explanation": "Explanation of why this change improves the code",
-      "test_code": "Unit test code that validates this change works correctly" 
-    }}
-  ],
-  "summary": "A concise summary of the main improvements suggested"
-}}
-
-IMPORTANT GUIDELINES:
-1. Make sure your suggestions are concrete, specific, and would genuinely improve the codebase.
-2. Focus on the most impactful changes.
-3. For EACH suggested change, you MUST include test code that validates the change works correctly.
-4. The tests should be comprehensive and follow best practices for the language.
-5. If modifying existing functionality, ensure tests verify the functionality still works as expected.
-6. If this is your own code, consider how you could improve yourself to be more effective.
-7. Review the changelog to ensure your suggestions build upon previous improvements and don't conflict with them.
+File content:
+{fence}{_language_hint(file_path)}
+{file_content_str}
+{fence}
 """
 
             # Call OpenRouter API
-            response = self.call_openrouter_api(prompt)
+            response = self.call_openrouter_api(prompt, cached_prefix=self._analysis_prefix())
             
             # Extract JSON from the response
             analysis_text = response['choices'][0]['message']['content']
             logger.info(f"Received analysis response for {file_path}")
             
-            # Try to parse the response directly first
-            try:
-                analysis_json = json.loads(analysis_text)
-                if isinstance(analysis_json, dict) and 'analysis' in analysis_json:
-                    return {
-                        'file_path': file_path,
-                        'analysis': analysis_json
-                    }
-            except json.JSONDecodeError:
-                pass
-            
-            # Try to extract JSON from code blocks
-            json_match = re.search(r'```(?:json)?\s*(\{[\s\S]*?\})\s*```', analysis_text)
-            if json_match:
-                try:
-                    analysis_json = json.loads(json_match.group(1))
-                    if isinstance(analysis_json, dict) and 'analysis' in analysis_json:
-                        return {
-                            'file_path': file_path,
-                            'analysis': analysis_json
-                        }
-                except json.JSONDecodeError:
-                    logger.warning(f"Found code block but couldn't parse JSON for {file_path}")
-            
-            # Try to find any JSON-like structure in the response
-            json_match = re.search(r'(\{\s*"analysis"[\s\S]*?\}\s*$)', analysis_text)
-            if json_match:
-                try:
-                    analysis_json = json.loads(json_match.group(1))
-                    if isinstance(analysis_json, dict) and 'analysis' in analysis_json:
-                        return {
-                            'file_path': file_path,
-                            'analysis': analysis_json
-                        }
-                except json.JSONDecodeError:
-                    logger.warning(f"Found JSON-like structure but couldn't parse for {file_path}")
-            
-            # Last resort: try to extract any valid JSON object from the text
-            try:
-                # Find anything that looks like a JSON object with "analysis" key
-                potential_json = re.search(r'(\{\s*"analysis"[\s\S]*?\})', analysis_text)
-                if potential_json:
-                    analysis_json = json.loads(potential_json.group(1))
-                    if isinstance(analysis_json, dict) and 'analysis' in analysis_json:
-                        return {
-                            'file_path': file_path,
-                            'analysis': analysis_json
-                        }
-            except Exception:
-                pass
+            analysis_json = _find_json_object(analysis_text, 'analysis')
+            if analysis_json is not None:
+                return {
+                    'file_path': file_path,
+                    'analysis': analysis_json,
+                    **source
+                }
             
             logger.warning(f"Could not parse JSON from response for {file_path}")
             return None
@@ -228,40 +854,108 @@ IMPORTANT GUIDELINES:
             logger.error(f"Error analyzing file {file_path}: {str(e)}")
             return None
 
-    def call_openrouter_api(self, prompt):
-        """Call the OpenRouter API with the given prompt."""
-        headers = {
-            "Authorization": f"Bearer {self.openrouter_api_key}",
-            "Content-Type": "application/json"
-        }
+    def call_openrouter_api(self, prompt, cached_prefix=None):
+        """Call the OpenRouter API with the given prompt.
+        
+        Args:
+            prompt: The per-call part of the user message
+            cached_prefix: Optional list of texts placed before the prompt and
+                marked as cacheable, so providers that support prompt caching
+                reuse them across calls instead of reprocessing them
+        """
+        user_content = prompt
+        if cached_prefix:
+            user_content = [
+                {"type": "text", "text": text, "cache_control": {"type": "ephemeral"}}
+                for text in cached_prefix
+            ]
+            user_content.append({"type": "text", "text": prompt})
         
         data = {
             "model": self.model,
             "messages": [
-                {"role": "system", "content": "You are RepoSage, an expert code analyzer that suggests concrete improvements to codebases, including your own. Always include tests for any changes you suggest, and consider how you could improve your own code. Each change you suggest should build upon previous improvements documented in the project's changelog."},
-                {"role": "user", "content": prompt}
+                {
+                    "role": "system",
+                    "content": [
+                        {"type": "text", "text": SYSTEM_PROMPT, "cache_control": {"type": "ephemeral"}}
+                    ]
+                },
+                {"role": "user", "content": user_content}
             ],
             "max_tokens": MAX_TOKENS
         }
+        if self.stream_responses:
+            data["stream"] = True
         
-        response = requests.post(
-            "https://openrouter.ai/api/v1/chat/completions",
-            headers=headers,
-            json=data
-        )
+        for attempt in range(OPENROUTER_MAX_RETRIES + 1):
+            self._rate_limiter.acquire()
+            response = self.http.post(
+                "https://openrouter.ai/api/v1/chat/completions",
+                json=data,
+                stream=self.stream_responses
+            )
+            
+            # Rate limits and server errors are retried, honouring Retry-After when given
+            if (response.status_code == 429 or response.status_code >= 500) and attempt < OPENROUTER_MAX_RETRIES:
+                delay = _retry_delay(response, attempt)
+                logger.warning(f"OpenRouter API returned {response.status_code}, retrying in {delay:.1f}s")
+                response.close()
+                if response.status_code == 429:
+                    # The limit applies to every worker, so they all back off
+                    # rather than each running into it again
+                    self._rate_limiter.pause(delay)
+                else:
+                    time.sleep(delay)
+                continue
+            break
         
         if response.status_code != 200:
             logger.error(f"OpenRouter API error: {response.status_code} - {response.text}")
             raise Exception(f"OpenRouter API error: {response.status_code}")
+        
+        if self.stream_responses:
+            try:
+                return self._read_stream(response)
+            finally:
+                response.close()
             
-        return response.json()
+        # Parsed from the raw bytes, skipping requests' own decoding
+        return orjson.loads(response.content)
+
+    def _read_stream(self, response):
+        """Collect a streamed (server-sent events) completion.
+        
+        Args:
+            response: Streaming response from the chat completions endpoint
+            
+        Returns:
+            The completion in the same shape as a non-streamed response
+        """
+        content_parts = []
+        for line in response.iter_lines():
+            # Skip keep-alive comments and blank separators
+            if not line.startswith(b"data:"):
+                continue
+            payload = line[len(b"data:"):].strip()
+            if payload == b"[DONE]":
+                break
+            
+            event = orjson.loads(payload)
+            if 'error' in event:
+                raise Exception(f"OpenRouter API error: {event['error']}")
+            for choice in event.get('choices', []):
+                content = choice.get('delta', {}).get('content')
+                if content:
+                    content_parts.append(content)
+        
+        return {'choices': [{'message': {'content': "".join(content_parts)}}]}
 
     def implement_changes(self, file_analysis, dry_run=False):
         """Implement the suggested changes for a file.
         
         Args:
             file_analysis: Dictionary containing file path and analysis
-            dry_run: If True, don't actually commit the changes
+            dry_run: If True, log the changes and test files that would be made
             
         Returns:
             Dictionary with details of changes made, or None if no changes
@@ -277,71 +971,25 @@ IMPORTANT GUIDELINES:
             return None
         
         try:
-            # Get the file content
-            file_contents = self.repo.get_contents(file_path, ref=self.base_branch)
-            content = base64.b64decode(file_contents.content).decode('utf-8')
+            # Get the file content, reusing the copy downloaded for the analysis if there is one
+            if 'original_content' in file_analysis:
+                content = file_analysis['original_content']
+                file_sha = file_analysis['content_sha']
+            else:
+                file_contents = self._get_contents(file_path, ref=self.base_branch)
+                content = _decode_content(file_contents)
+                file_sha = file_contents.sha
             original_content = content
             
-            # Apply each change to the content
-            changes_applied = 0
-            for change in analysis['suggested_changes']:
-                if 'original_code' in change and 'improved_code' in change:
-                    original = change['original_code']
-                    improved = change['improved_code']
-                    
-                    # Only apply the change if the original code exists in the file
-                    if original in content:
-                        content = content.replace(original, improved)
-                        changes_applied += 1
+            # Apply every change to the content in a single pass
+            content, changes_applied = _apply_changes(content, analysis['suggested_changes'])
             
             # Check if the content actually changed
             if content == original_content or changes_applied == 0:
                 logger.info(f"No changes made to {file_path}")
                 return None
             
-            # Generate commit message
-            message_details = self.generate_commit_message(file_path, analysis['suggested_changes'])
-            
-            if not dry_run:
-                # Update the file in the repository
-                self.repo.update_file(
-                    file_path,
-                    message_details,
-                    content,
-                    file_contents.sha,
-                    branch=self.branch_name
-                )
-                logger.info(f"Updated {file_path} with changes")
-                
-                # Create or update test files based on the changes
-                test_files = self.implement_tests(file_path, analysis['suggested_changes'])
-                
-                # Commit test files
-                for test_file_path, test_file_info in test_files.items():
-                    try:
-                        test_message = f"Add tests for changes to {file_path}"
-                        if test_file_info['exists']:
-                            # Update existing test file
-                            self.repo.update_file(
-                                test_file_path,
-                                test_message,
-                                test_file_info['content'],
-                                test_file_info['sha'],
-                                branch=self.branch_name
-                            )
-                            logger.info(f"Updated test file {test_file_path}")
-                        else:
-                            # Create new test file
-                            self.repo.create_file(
-                                test_file_path,
-                                test_message,
-                                test_file_info['content'],
-                                branch=self.branch_name
-                            )
-                            logger.info(f"Created test file {test_file_path}")
-                    except Exception as e:
-                        logger.error(f"Error committing test file {test_file_path}: {str(e)}")
-            else:
+            if dry_run:
                 logger.info(f"Dry run: would update {file_path} with changes")
                 
                 # Log test files that would be created
@@ -353,6 +1001,7 @@ IMPORTANT GUIDELINES:
                 'file_path': file_path,
                 'content': content,
                 'original_content': original_content,  # Store original content for diff generation
+                'sha': file_sha,  # Blob SHA of the base version the changes apply to
                 'changes_applied': changes_applied,
                 'analysis': analysis
             }
@@ -360,11 +1009,27 @@ IMPORTANT GUIDELINES:
             logger.error(f"Error implementing changes to {file_path}: {str(e)}")
             return None
 
+    def close(self):
+        """Release the HTTP connections and the local clones, if any."""
+        self.http.close()
+        self.github_http.close()
+        if self._blob_reader is not None:
+            self._blob_reader.close()
+            self._blob_reader = None
+        if self._test_dir is not None:
+            shutil.rmtree(self._test_dir, ignore_errors=True)
+            self._test_dir = None
+
+    def _base_sha(self):
+        """Return the base commit the files were listed from, or the branch head."""
+        if self._base_commit_sha is None:
+            self._base_commit_sha = self.repo.get_branch(self.base_branch).commit.sha
+        return self._base_commit_sha
+
     def create_branch(self):
         """Create a new branch for the improvements."""
         try:
-            source = self.repo.get_branch(self.base_branch)
-            self.repo.create_git_ref(ref=f"refs/heads/{self.branch_name}", sha=source.commit.sha)
+            self.repo.create_git_ref(ref=f"refs/heads/{self.branch_name}", sha=self._base_sha())
             logger.info(f"Created branch: {self.branch_name}")
             return True
         except Exception as e:
@@ -377,16 +1042,19 @@ IMPORTANT GUIDELINES:
             file_path = file_changes['file_path']
             new_content = file_changes['content']
             
-            file = self.repo.get_contents(file_path, ref=self.branch_name)
             commit_message = f"Improve {file_path}: {file_changes['analysis'].get('summary', 'Code improvements')}"[:100]
             
-            self.repo.update_file(
-                file.path,
-                commit_message,
-                new_content,
-                file.sha,
-                branch=self.branch_name
-            )
+            # Use the base blob SHA recorded by implement_changes when there is one
+            recorded_sha = file_changes.get('sha')
+            file_sha = recorded_sha or self._get_contents(file_path, ref=self.branch_name).sha
+            try:
+                self.repo.update_file(file_path, commit_message, new_content, file_sha, branch=self.branch_name)
+            except GithubException as e:
+                if e.status != 409 or not recorded_sha:
+                    raise
+                # The file changed on the branch since the base; retry against its current version
+                file_sha = self._get_contents(file_path, ref=self.branch_name).sha
+                self.repo.update_file(file_path, commit_message, new_content, file_sha, branch=self.branch_name)
             
             logger.info(f"Committed changes to {file_path}")
             return True
@@ -401,26 +1069,38 @@ IMPORTANT GUIDELINES:
             return None
             
         try:
+            if len(all_changes) == 1:
+                # A single file reads like an individual pull request
+                file_path = all_changes[0]['file_path']
+                pr = self.repo.create_pull(
+                    title=f"RepoSage: Improve {file_path}",
+                    body=self._single_file_pr_body(file_path, all_changes[0]['analysis']),
+                    head=self.branch_name,
+                    base=self.base_branch
+                )
+                logger.info(f"Created pull request: {pr.html_url}")
+                return pr
+            
             # Generate PR title and body
             pr_title = f"RepoSage: Code improvements ({len(all_changes)} files)"
             
-            pr_body = "# 🧙 RepoSage: AI-Suggested Code Improvements\n\n"
-            pr_body += f"This pull request contains improvements suggested by RepoSage across {len(all_changes)} files.\n\n"
+            pr_body_parts = [
+                "# 🧙 RepoSage: AI-Suggested Code Improvements\n\n",
+                f"This pull request contains improvements suggested by RepoSage across {len(all_changes)} files.\n\n"
+            ]
             
-            for change in all_changes:
-                file_path = change['file_path']
-                analysis = change['analysis']
-                
-                pr_body += f"## 📄 {file_path}\n\n"
-                pr_body += f"### Summary\n{analysis.get('summary', 'Code improvements')}\n\n"
-                
-                if 'suggested_changes' in analysis:
-                    pr_body += "### Changes\n\n"
-                    for idx, suggestion in enumerate(analysis['suggested_changes'], 1):
-                        if 'explanation' in suggestion:
-                            pr_body += f"**Change {idx}**: {suggestion['explanation']}\n\n"
-                
-                pr_body += "---\n\n"
+            # Stop adding file sections before the body outgrows GitHub's limit,
+            # leaving room for the note about the files left out
+            body_length = sum(map(len, pr_body_parts))
+            for idx, change in enumerate(all_changes):
+                section = "".join(self._pr_file_section(change['file_path'], change['analysis'])) + "---\n\n"
+                if body_length + len(section) > MAX_PR_BODY_CHARS - 100:
+                    pr_body_parts.append(f"…and {len(all_changes) - idx} more changed files, not listed here.\n")
+                    break
+                pr_body_parts.append(section)
+                body_length += len(section)
+            
+            pr_body = "".join(pr_body_parts)
             
             # Create the pull request
             pr = self.repo.create_pull(
@@ -436,12 +1116,38 @@ IMPORTANT GUIDELINES:
             logger.error(f"Error creating pull request: {str(e)}")
             return None
 
-    def analyze_files_parallel(self, files, max_workers=None):
+    @staticmethod
+    def _single_file_pr_body(file_path, analysis):
+        """Return the body of a pull request changing a single file."""
+        return "".join([
+            "# 🧙 RepoSage: AI-Suggested Code Improvements\n\n",
+            f"This pull request contains improvements for `{file_path}`.\n\n",
+            *RepoSage._pr_file_section(file_path, analysis)
+        ])
+
+    @staticmethod
+    def _pr_file_section(file_path, analysis):
+        """Return the parts of a pull request body describing one file's changes."""
+        parts = [
+            f"## 📄 {file_path}\n\n",
+            f"### Summary\n{analysis.get('summary', 'Code improvements')}\n\n"
+        ]
+        
+        if 'suggested_changes' in analysis:
+            parts.append("### Changes\n\n")
+            for idx, suggestion in enumerate(analysis['suggested_changes'], 1):
+                if 'explanation' in suggestion:
+                    parts.append(f"**Change {idx}**: {suggestion['explanation']}\n\n")
+        return parts
+
+    def analyze_files_parallel(self, files, max_workers=None, on_result=None):
         """Analyze files in parallel using a thread pool.
         
         Args:
             files: List of file contents to analyze
-            max_workers: Maximum number of worker threads (None = auto-determine based on CPU count)
+            max_workers: Maximum number of worker threads (None = one per pooled OpenRouter connection)
+            on_result: Optional callable given each analysis as soon as it completes,
+                in the calling thread, while other files are still being analyzed
             
         Returns:
             List of file analysis results
@@ -458,6 +1164,8 @@ IMPORTANT GUIDELINES:
                     if result:
                         results.append(result)
                         logger.info(f"Completed analysis of {result['file_path']}")
+                        if on_result:
+                            on_result(result)
                     else:
                         logger.warning(f"Analysis failed for {file_content.path}")
                 except Exception as e:
@@ -468,7 +1176,8 @@ IMPORTANT GUIDELINES:
         
         # Parallel analysis using thread pool
         logger.info("Using parallel analysis with thread pool")
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # The work is I/O-bound, so size the pool to the HTTP connection pool rather than the CPU count
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or OPENROUTER_POOL_SIZE) as executor:
             # Submit all file analysis tasks
             future_to_file = {executor.submit(self.analyze_file, file_content): file_content for file_content in files}
             
@@ -480,6 +1189,8 @@ IMPORTANT GUIDELINES:
                     if result:
                         results.append(result)
                         logger.info(f"Completed analysis of {result['file_path']}")
+                        if on_result:
+                            on_result(result)
                     else:
                         logger.warning(f"Analysis failed for {file_content.path}")
                 except Exception as e:
@@ -488,72 +1199,197 @@ IMPORTANT GUIDELINES:
         logger.info(f"Parallel analysis complete. {len(results)} files analyzed successfully.")
         return results
 
+    def analyze_files_batched(self, files, max_batch_bytes=MAX_BATCH_BYTES, max_workers=None, on_result=None):
+        """Analyze files with several small files packed into each request.
+        
+        Args:
+            files: List of file contents to analyze
+            max_batch_bytes: Largest combined size of the files sent in one request
+            max_workers: Maximum number of worker threads (None = one per pooled OpenRouter connection)
+            on_result: Optional callable given each analysis as soon as its batch completes
+            
+        Returns:
+            List of file analysis results
+        """
+        batches = _pack_batches(files, max_batch_bytes)
+        logger.info(f"Starting analysis of {len(files)} files in {len(batches)} requests...")
+        results = []
+        
+        if not self.use_parallel:
+            for batch in batches:
+                batch_results = self.analyze_batch(batch)
+                results.extend(batch_results)
+                if on_result:
+                    for result in batch_results:
+                        on_result(result)
+        else:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers or OPENROUTER_POOL_SIZE) as executor:
+                futures = [executor.submit(self.analyze_batch, batch) for batch in batches]
+                for future in concurrent.futures.as_completed(futures):
+                    batch_results = future.result()
+                    results.extend(batch_results)
+                    if on_result:
+                        for result in batch_results:
+                            on_result(result)
+        
+        logger.info(f"Batched analysis complete. {len(results)} files analyzed successfully.")
+        return results
+
+    def analyze_batch(self, files):
+        """Analyze several files with a single OpenRouter request.
+        
+        A batch of one file is analyzed with analyze_file.
+        
+        Args:
+            files: List of file contents to analyze together
+            
+        Returns:
+            List of file analysis results for the files the model answered
+        """
+        if len(files) == 1:
+            result = self.analyze_file(files[0])
+            return [result] if result else []
+        
+        paths = [file_content.path for file_content in files]
+        try:
+            logger.info(f"Analyzing {len(files)} files in one request: {', '.join(paths)}")
+            
+            sections = []
+            for index, file_content in enumerate(files, 1):
+                file_content_str = self._read_blob(file_content).decode('utf-8', 'replace')
+                fence = _code_fence(file_content_str)
+                sections.append(f"=== FILE {index}: {file_content.path} ===\n{fence}{_language_hint(file_content.path)}\n{file_content_str}\n{fence}\n")
+            
+            prompt = f"""{BATCH_INSTRUCTIONS}
+
+{f'Focus on the following aspects: {self.description}' if self.description else ''}
+
+{chr(10).join(sections)}"""
+            
+            response = self.call_openrouter_api(prompt, cached_prefix=self._analysis_prefix())
+            analysis_text = response['choices'][0]['message']['content']
+            logger.info(f"Received batched analysis response for {len(files)} files")
+            
+            # Keep one entry per requested file, ignoring anything else the model returned
+            results = []
+            unanswered = set(paths)
+            for entry in _parse_batch_response(analysis_text):
+                if not isinstance(entry, dict) or not isinstance(entry.get('file_path'), str) or entry['file_path'] not in unanswered:
+                    continue
+                unanswered.discard(entry['file_path'])
+                analysis_json = {key: value for key, value in entry.items() if key != 'file_path'}
+                if 'analysis' in analysis_json:
+                    results.append({
+                        'file_path': entry['file_path'],
+                        'analysis': analysis_json
+                    })
+            
+            if not results:
+                logger.warning(f"Could not parse batched response for {', '.join(paths)}")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error analyzing batch {', '.join(paths)}: {str(e)}")
+            return []
+
     def create_individual_pull_requests(self, changes_list):
         """Create individual pull requests for each file change.
         
+        Each file gets its own branch, so the pull requests are independent and
+        are created concurrently unless parallel processing is disabled.
+        
         Args:
             changes_list: List of file changes to commit
             
         Returns:
             List of created pull request URLs
         """
-        pr_urls = []
+        if not changes_list:
+            return []
         
-        for file_changes in changes_list:
-            try:
-                file_path = file_changes['file_path']
-                # Create a unique branch for this file
-                file_branch = f"{self.branch_name}-{Path(file_path).stem}"
-                
-                # Create branch from base
-                source = self.repo.get_branch(self.base_branch)
-                self.repo.create_git_ref(ref=f"refs/heads/{file_branch}", sha=source.commit.sha)
-                logger.info(f"Created branch for individual file: {file_branch}")
-                
-                # Commit changes to this branch
-                file = self.repo.get_contents(file_path, ref=file_branch)
-                commit_message = f"Improve {file_path}: {file_changes['analysis'].get('summary', 'Code improvements')}"[:100]
-                
-                self.repo.update_file(
-                    file.path,
-                    commit_message,
-                    file_changes['content'],
-                    file.sha,
-                    branch=file_branch
-                )
-                
-                # Create PR for this file
-                pr_title = f"RepoSage: Improve {file_path}"
-                
-                pr_body = "# 🧙 RepoSage: AI-Suggested Code Improvements\n\n"
-                pr_body += f"This pull request contains improvements for `{file_path}`.\n\n"
-                
-                # Add details about the changes
-                analysis = file_changes['analysis']
-                pr_body += f"## 📄 {file_path}\n\n"
-                pr_body += f"### Summary\n{analysis.get('summary', 'Code improvements')}\n\n"
-                
-                if 'suggested_changes' in analysis:
-                    pr_body += "### Changes\n\n"
-                    for idx, suggestion in enumerate(analysis['suggested_changes'], 1):
-                        if 'explanation' in suggestion:
-                            pr_body += f"**Change {idx}**: {suggestion['explanation']}\n\n"
-                
-                # Create the PR
-                pr = self.repo.create_pull(
-                    title=pr_title,
-                    body=pr_body,
-                    head=file_branch,
-                    base=self.base_branch
-                )
-                
-                logger.info(f"Created individual PR for {file_path}: {pr.html_url}")
-                pr_urls.append(pr.html_url)
-                
-            except Exception as e:
-                logger.error(f"Error creating PR for {file_changes['file_path']}: {str(e)}")
+        # Every branch starts from the same base commit
+        try:
+            base_sha = self._base_sha()
+        except Exception as e:
+            logger.error(f"Error reading base branch {self.base_branch}: {str(e)}")
+            return []
         
-        return pr_urls
+        branches = self._file_branch_names([file_changes['file_path'] for file_changes in changes_list])
+        if not self.use_parallel or len(changes_list) == 1:
+            results = [self._create_pr_for_file(file_changes, base_sha, branch) for file_changes, branch in zip(changes_list, branches)]
+        else:
+            max_workers = min(MAX_PR_WORKERS, len(changes_list))
+            with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(lambda file_changes, branch: self._create_pr_for_file(file_changes, base_sha, branch), changes_list, branches))
+        
+        return [pr_url for pr_url in results if pr_url]
+
+    def _file_branch_names(self, file_paths):
+        """Return the branch name for each file's individual pull request.
+        
+        Branches are named after the file's stem; files sharing a stem (such as
+        two __init__.py files) also get a short hash of their path so their
+        branches do not collide.
+        """
+        stems = [os.path.splitext(os.path.basename(file_path))[0] for file_path in file_paths]
+        stem_counts = Counter(stems)
+        names = []
+        for file_path, stem in zip(file_paths, stems):
+            if stem_counts[stem] > 1:
+                stem = f"{stem}-{hashlib.sha1(file_path.encode('utf-8')).hexdigest()[:7]}"
+            names.append(f"{self.branch_name}-{stem}")
+        return names
+
+    def _create_pr_for_file(self, file_changes, base_sha, file_branch):
+        """Create a branch and a pull request for a single file change.
+        
+        Args:
+            file_changes: Dictionary with the file path, new content and analysis
+            base_sha: Commit SHA the new branch starts from
+            file_branch: Name of the branch to create for this file
+            
+        Returns:
+            URL of the created pull request, or None if it could not be created
+        """
+        try:
+            file_path = file_changes['file_path']
+            
+            # Create branch from base
+            self.repo.create_git_ref(ref=f"refs/heads/{file_branch}", sha=base_sha)
+            logger.info(f"Created branch for individual file: {file_branch}")
+            
+            # Commit changes to this branch; it starts at the base commit, so the
+            # file's base blob SHA recorded by implement_changes is still current
+            file_sha = file_changes.get('sha')
+            if file_sha is None:
+                file_sha = self._get_contents(file_path, ref=file_branch).sha
+            commit_message = f"Improve {file_path}: {file_changes['analysis'].get('summary', 'Code improvements')}"[:100]
+            
+            self.repo.update_file(
+                file_path,
+                commit_message,
+                file_changes['content'],
+                file_sha,
+                branch=file_branch
+            )
+            
+            # Create PR for this file
+            pr_title = f"RepoSage: Improve {file_path}"
+            
+            # Create the PR
+            pr = self.repo.create_pull(
+                title=pr_title,
+                body=self._single_file_pr_body(file_path, file_changes['analysis']),
+                head=file_branch,
+                base=self.base_branch
+            )
+            
+            logger.info(f"Created individual PR for {file_path}: {pr.html_url}")
+            return pr.html_url
+            
+        except Exception as e:
+            logger.error(f"Error creating PR for {file_changes['file_path']}: {str(e)}")
+            return None
 
     def save_changes_to_file(self, changes_list, output_file):
         """Save changes to a JSON file for later review.
@@ -580,8 +1416,8 @@ IMPORTANT GUIDELINES:
                 serializable_changes.append(serializable_change)
             
             # Write to file
-            with open(output_file, 'w') as f:
-                json.dump(serializable_changes, f, indent=2)
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(serializable_changes, option=orjson.OPT_INDENT_2))
             
             logger.info(f"Saved changes to {output_file}")
             return True
@@ -613,17 +1449,12 @@ IMPORTANT GUIDELINES:
             
             logger.info(f"Committing {total_changes} changes to {self.base_branch}")
             
+            # Build each change's test files once; they are both run and committed
+            files, test_files = self._files_to_commit(changes_list)
+            
             # Run tests if requested
             if run_tests:
-                # Get all the test files that were created/updated
-                test_files = []
-                for change in changes_list:
-                    # Extract test files from changes
-                    file_path = change['file_path']
-                    test_files_for_change = self.implement_tests(file_path, change['analysis']['suggested_changes'])
-                    test_files.extend(list(test_files_for_change.keys()))
-                
-                test_success, test_output = self.run_tests(test_files)
+                test_success, test_output = self.run_tests(test_files, files=files)
                 if not test_success:
                     logger.error(f"Tests failed, aborting commit:\n{test_output}")
                     return False, f"Tests failed: {test_output}"
@@ -637,72 +1468,83 @@ IMPORTANT GUIDELINES:
             else:
                 logger.warning(f"Could not update changelog: {changelog_message}")
             
-            # Apply each change directly to the base branch
-            success_count = 0
-            for change in changes_list:
-                file_path = change['file_path']
-                new_content = change['content']
-                
-                try:
-                    # Get the current file content from the base branch
-                    file_content = self.repo.get_contents(file_path, ref=self.base_branch)
-                    
-                    # Generate commit message
-                    commit_msg = self.generate_commit_message(file_path, change['analysis']['suggested_changes'])
-                    
-                    # Update the file
-                    self.repo.update_file(
-                        file_path,
-                        commit_msg,
-                        new_content,
-                        file_content.sha,
-                        branch=self.base_branch
-                    )
-                    logger.info(f"Successfully updated {file_path} in {self.base_branch}")
-                    success_count += 1
-                    
-                    # Commit test files if they exist
-                    test_files = self.implement_tests(file_path, change['analysis']['suggested_changes'])
-                    for test_file_path, test_file_info in test_files.items():
-                        try:
-                            test_message = f"Add tests for changes to {file_path}"
-                            try:
-                                # Try to get existing test file
-                                existing_test_file = self.repo.get_contents(test_file_path, ref=self.base_branch)
-                                
-                                # Update existing test file
-                                self.repo.update_file(
-                                    test_file_path,
-                                    test_message,
-                                    test_file_info['content'],
-                                    existing_test_file.sha,
-                                    branch=self.base_branch
-                                )
-                                logger.info(f"Updated test file {test_file_path} in {self.base_branch}")
-                            except Exception:
-                                # Test file doesn't exist, create it
-                                self.repo.create_file(
-                                    test_file_path,
-                                    test_message,
-                                    test_file_info['content'],
-                                    branch=self.base_branch
-                                )
-                                logger.info(f"Created test file {test_file_path} in {self.base_branch}")
-                        except Exception as e:
-                            logger.error(f"Error committing test file {test_file_path}: {str(e)}")
-                            
-                except Exception as e:
-                    logger.error(f"Error committing {file_path} to {self.base_branch}: {str(e)}")
-            
-            if success_count > 0:
-                return True, f"Successfully committed {success_count} changes to {self.base_branch}"
-            else:
-                return False, "Failed to commit any changes"
+            commit = self._commit_files(files, self._combined_commit_message(commit_messages), self.base_branch)
+            logger.info(f"Committed {len(files)} files to {self.base_branch} in {commit.sha}")
+            return True, f"Successfully committed {len(changes_list)} changes to {self.base_branch}"
                 
         except Exception as e:
             logger.error(f"Error during direct commit: {str(e)}")
             return False, f"Error: {str(e)}"
 
+    def commit_changes_to_branch(self, changes_list):
+        """Commit every change, with its tests, to the feature branch as a single commit.
+        
+        Args:
+            changes_list: List of changes to commit
+            
+        Returns:
+            True if the changes were committed, False otherwise
+        """
+        try:
+            commit_messages, _ = self.generate_commit_messages(changes_list)
+            files, _ = self._files_to_commit(changes_list)
+            commit = self._commit_files(files, self._combined_commit_message(commit_messages), self.branch_name)
+            logger.info(f"Committed {len(files)} files to {self.branch_name} in {commit.sha}")
+            return True
+        except Exception as e:
+            logger.error(f"Error committing changes: {str(e)}")
+            return False
+
+    def _files_to_commit(self, changes_list):
+        """Collect the changed source files and their generated test files.
+        
+        Returns:
+            Tuple of (files, test_files): a dictionary mapping every path to its
+            new content, and the paths of the test files among them
+        """
+        files = {}
+        test_files = []
+        for change in changes_list:
+            files[change['file_path']] = change['content']
+            for test_file_path, test_file_info in self.implement_tests(change['file_path'], change['analysis']['suggested_changes']).items():
+                files[test_file_path] = test_file_info['content']
+                test_files.append(test_file_path)
+        return files, test_files
+
+    @staticmethod
+    def _combined_commit_message(commit_messages):
+        """Return one commit message covering the messages of several files."""
+        if len(commit_messages) == 1:
+            return commit_messages[0]
+        return f"RepoSage: Improve {len(commit_messages)} files\n\n" + "\n".join(commit_messages)
+
+    def _commit_files(self, files, message, branch):
+        """Commit several files to a branch as a single commit.
+        
+        Uses the Git Data API: the new file contents are sent inline with one
+        tree creation, so the number of round trips does not grow with the
+        number of files. Files listed by fetch_repo_files keep their mode.
+        
+        Args:
+            files: Dictionary mapping file paths to their new content
+            message: Commit message
+            branch: Branch to commit to
+            
+        Returns:
+            The created GitCommit
+        """
+        ref = self.repo.get_git_ref(f"heads/{branch}")
+        parent = self.repo.get_git_commit(ref.object.sha)
+        
+        elements = [
+            InputGitTreeElement(path, self._file_modes.get(path, BLOB_FILE_MODE), "blob", content=content)
+            for path, content in files.items()
+        ]
+        tree = self.repo.create_git_tree(elements, parent.tree)
+        commit = self.repo.create_git_commit(message, tree, [parent])
+        ref.edit(commit.sha)
+        return commit
+
     def run(self, dry_run=False, output_file=None, max_workers=None, direct_commit=True):
         """Run the RepoSage analysis and improvement process.
         
@@ -735,33 +1577,39 @@ IMPORTANT GUIDELINES:
         filtered_files = [f for f in all_files if self.should_analyze_file(f)]
         logger.info(f"Analyzing {len(filtered_files)} files (excluded large files and ignored paths)")
         
-        # Create branch for changes if not in dry-run mode and not direct commit
+        # Create branch for changes if not in dry-run mode and not direct commit;
+        # it is created in the background while the analyses run, and every
+        # write to it (the changelog created on first read, the final commit)
+        # waits for it first
+        self._branch_future = None
         if not dry_run and not direct_commit:
-            self.create_branch()
+            branch_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+            self._branch_future = branch_executor.submit(self.create_branch)
+            branch_executor.shutdown(wait=False)
         
-        # Iterate through each file for analysis
-        all_analyses = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all file analysis tasks
-            future_to_file = {executor.submit(self.analyze_file, file_path): file_path for file_path in filtered_files}
-            
-            # Process results as they complete
-            for future in concurrent.futures.as_completed(future_to_file):
-                file_path = future_to_file[future]
-                try:
-                    file_analysis = future.result()
-                    if file_analysis:
-                        all_analyses.append(file_analysis)
-                except Exception as e:
-                    logger.error(f"Error analyzing {file_path}: {str(e)}")
+        # Keep a pooled OpenRouter connection for every worker, so none is discarded after use
+        if max_workers and max_workers > OPENROUTER_POOL_SIZE:
+            self.http.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=max_workers))
         
-        # Save all analyses to file if requested
-        if output_file and all_analyses:
-            self.save_analyses_to_file(all_analyses, output_file)
-            logger.info(f"Saved analyses to {output_file}")
+        # Only files that changed since a cached analysis need another LLM call
+        dependency_keys = {f.path: self._dependency_key(f.path) for f in filtered_files}
+        changed_files = [
+            f for f in filtered_files
+            if self._cache.is_stale(f.sha, self.model, dependency_keys[f.path])
+        ]
+        if len(changed_files) < len(filtered_files):
+            logger.info(f"Skipping {len(filtered_files) - len(changed_files)} unchanged files via cache")
+        
+        files_by_path = {f.path: f for f in changed_files}
+        # Analyses whose changes are only cached once they have been committed
+        pending_cache_entries = []
         
-        # Implement changes for each file with suggested improvements
-        for file_analysis in all_analyses:
+        def cache_entry(file_analysis):
+            file_content = files_by_path[file_analysis['file_path']]
+            return (file_content.sha, self.model, file_analysis['analysis'], dependency_keys[file_content.path])
+        
+        def handle_analysis(file_analysis):
+            """Implement one analysis's changes while other files are still analyzed."""
             if 'analysis' in file_analysis and 'suggested_changes' in file_analysis['analysis'] and file_analysis['analysis']['suggested_changes']:
                 logger.info(f"Implementing changes for {file_analysis['file_path']}")
                 
@@ -774,6 +1622,25 @@ IMPORTANT GUIDELINES:
                     file_changes = self.implement_changes(file_analysis, dry_run=dry_run)
                     if file_changes:
                         changes_list.append(file_changes)
+                        pending_cache_entries.append(cache_entry(file_analysis))
+            elif not dry_run:
+                # Nothing to change, so the file need not be analyzed again
+                self._cache.record(*cache_entry(file_analysis))
+        
+        # Iterate through each file for analysis
+        if self.batch_bytes:
+            # Small files share requests
+            all_analyses = self.analyze_files_batched(changed_files, self.batch_bytes, max_workers, on_result=handle_analysis)
+        else:
+            all_analyses = self.analyze_files_parallel(changed_files, max_workers, on_result=handle_analysis)
+        
+        # Save all analyses to file if requested
+        if output_file and all_analyses:
+            self.save_analyses_to_file(all_analyses, output_file)
+            logger.info(f"Saved analyses to {output_file}")
+        
+        if self._branch_future is not None:
+            self._branch_future.result()
         
         # Update changelog with the changes
         if changes_list:
@@ -791,12 +1658,22 @@ IMPORTANT GUIDELINES:
                 else:
                     print(f"\n❌ {message}")
             else:
-                # Create a PR with the changes
-                pr_url = self.create_pull_request(changes_list)
+                # Commit every change to the feature branch at once, then open a PR
+                pr_url = None
+                if self.commit_changes_to_branch(changes_list):
+                    pr_url = self.create_pull_request(changes_list)
+                success = bool(pr_url)
                 if pr_url:
                     print(f"\n✅ Pull request created: {pr_url}")
                 else:
                     print("\n❌ Failed to create pull request")
+            
+            # Changes that did not land are analyzed again next run
+            if success:
+                for entry in pending_cache_entries:
+                    self._cache.record(*entry)
+        
+        self._cache.save()
         
         # Print summary
         if changes_list:
@@ -811,11 +1688,93 @@ IMPORTANT GUIDELINES:
         
         return changes_list
 
-    def run_tests(self, test_files=None):
+    def _dependency_key(self, file_path):
+        """Digest the dependency manifests in the directories above a file.
+        
+        Args:
+            file_path: Path of the file in the repository
+            
+        Returns:
+            A hex digest, or an empty string if no manifest governs the file
+        """
+        shas = []
+        for manifest_path, sha in sorted(self._manifest_shas.items()):
+            directory = os.path.dirname(manifest_path)
+            if not directory or file_path.startswith(directory + '/'):
+                shas.append(sha)
+        if not shas:
+            return ""
+        return hashlib.sha1("".join(shas).encode('utf-8')).hexdigest()
+
+    def _test_workdir(self):
+        """Return a working tree of the base branch's tip to run tests in.
+        
+        The repository is shallow-cloned on first use only; later calls fetch
+        the tip and reset the same tree, discarding files written by a previous
+        test run, instead of cloning again.
+        
+        Returns:
+            Path of the working tree
+            
+        Raises:
+            RuntimeError: If the repository cannot be cloned or updated
+        """
+        if self._test_dir is None:
+            test_dir = tempfile.mkdtemp(prefix="reposage-tests-")
+            # Shallow-clone only the tip of the base branch; the tests never need history
+            commands = [[
+                "git", "clone",
+                f"https://{self.github_token}@github.com/{self.repo_name}.git",
+                "--branch", self.base_branch,
+                "--depth", "1",
+                "--single-branch", test_dir
+            ]]
+        else:
+            test_dir = self._test_dir
+            commands = [
+                ["git", "-C", test_dir, "fetch", "--depth", "1", "origin", self.base_branch],
+                ["git", "-C", test_dir, "reset", "--hard", "FETCH_HEAD"],
+                ["git", "-C", test_dir, "clean", "-fdx"]
+            ]
+        
+        for command in commands:
+            git_process = subprocess.run(
+                command,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if git_process.returncode != 0:
+                if self._test_dir is None:
+                    shutil.rmtree(test_dir, ignore_errors=True)
+                raise RuntimeError(f"Failed to prepare repository for tests: {git_process.stderr}")
+        
+        self._test_dir = test_dir
+        return test_dir
+
+    @staticmethod
+    def _detect_test_command(test_dir):
+        """Determine what test command to run based on repo structure.
+        
+        Returns:
+            Tuple of (command, accepts_test_files), where accepts_test_files
+            tells whether specific test files can be appended to the command
+        """
+        if os.path.exists(os.path.join(test_dir, "pytest.ini")) or os.path.exists(os.path.join(test_dir, "tests")):
+            # Run pytest if it's a Python project with tests directory
+            return ["python", "-m", "pytest", "-v"], True
+        if os.path.exists(os.path.join(test_dir, "package.json")):
+            # Run npm test if it's a JavaScript/Node.js project
+            return ["npm", "test"], False
+        # Default to running Python's unittest
+        return ["python", "-m", "unittest", "discover"], False
+
+    def run_tests(self, test_files=None, files=None):
         """Run tests to ensure changes don't break functionality.
         
         Args:
             test_files: List of test files to run specifically (optional)
+            files: Dictionary mapping paths to the changed contents to test (optional)
             
         Returns:
             Tuple of (success, output) where success is a boolean indicating if tests passed
@@ -824,66 +1783,51 @@ IMPORTANT GUIDELINES:
         
         try:
             # For use in mocked tests, we can simulate running tests
-            if hasattr(self, 'mock_test_run'):
+            if self.mock_test_run is not None:
                 return self.mock_test_run
-                
-            # Clone the repository to a temporary directory to run tests
-            with tempfile.TemporaryDirectory() as temp_dir:
-                # Clone the repo with the current branch
-                clone_cmd = [
-                    "git", "clone", 
-                    f"https://{self.github_token}@github.com/{self.repo_name}.git",
-                    "--branch", self.branch_name,
-                    "--single-branch", temp_dir
-                ]
-                clone_process = subprocess.run(
-                    clone_cmd, 
-                    stdout=subprocess.PIPE, 
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                if clone_process.returncode != 0:
-                    logger.error(f"Failed to clone repository: {clone_process.stderr}")
-                    return False, clone_process.stderr
-                
-                # Determine what test command to run based on repo structure
-                if os.path.exists(os.path.join(temp_dir, "pytest.ini")) or os.path.exists(os.path.join(temp_dir, "tests")):
-                    # Run pytest if it's a Python project with tests directory
-                    test_cmd = ["python", "-m", "pytest"]
-                    if test_files:
-                        # If specific test files are provided, only run those
-                        test_cmd.extend(test_files)
-                    test_cmd.extend(["-v"])  # Verbose output
-                elif os.path.exists(os.path.join(temp_dir, "package.json")):
-                    # Run npm test if it's a JavaScript/Node.js project
-                    test_cmd = ["npm", "test"]
-                else:
-                    # Default to running Python's unittest
-                    test_cmd = ["python", "-m", "unittest", "discover"]
-                
-                # Run the test command
-                test_process = subprocess.run(
-                    test_cmd,
-                    cwd=temp_dir,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    text=True
-                )
-                
-                # Log test output
-                logger.info(f"Test output:\n{test_process.stdout}")
-                if test_process.stderr:
-                    logger.error(f"Test errors:\n{test_process.stderr}")
-                
-                # Return success if tests passed (return code 0)
-                success = test_process.returncode == 0
-                if success:
-                    output = test_process.stdout
-                else:
-                    output = f"{test_process.stdout}\n{test_process.stderr}".strip()
-                
-                return success, output
+            
+            try:
+                test_dir = self._test_workdir()
+            except RuntimeError as e:
+                logger.error(str(e))
+                return False, str(e)
+            
+            # Write the changes over the base branch's files so they are what gets tested
+            for file_path, content in (files or {}).items():
+                target = Path(test_dir, file_path)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                target.write_text(content, encoding='utf-8')
+            
+            # The repository layout does not change between runs, so detect the command once
+            if self._test_command is None:
+                self._test_command = self._detect_test_command(test_dir)
+            test_cmd, accepts_test_files = self._test_command
+            if accepts_test_files and test_files:
+                # If specific test files are provided, only run those
+                test_cmd = test_cmd + list(test_files)
+            
+            # Run the test command
+            test_process = subprocess.run(
+                test_cmd,
+                cwd=test_dir,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            
+            # Log test output
+            logger.info(f"Test output:\n{test_process.stdout}")
+            if test_process.stderr:
+                logger.error(f"Test errors:\n{test_process.stderr}")
+            
+            # Return success if tests passed (return code 0)
+            success = test_process.returncode == 0
+            if success:
+                output = test_process.stdout
+            else:
+                output = f"{test_process.stdout}\n{test_process.stderr}".strip()
+            
+            return success, output
                 
         except Exception as e:
             logger.error(f"Error running tests: {str(e)}")
@@ -903,11 +1847,11 @@ IMPORTANT GUIDELINES:
             return False
             
         # Skip files in ignored directories
-        if any(ignored_dir in file_content.path for ignored_dir in IGNORED_DIRECTORIES):
+        if IGNORED_PATH_PATTERN.search(file_content.path):
             return False
             
         # Skip unsupported file types
-        if not file_content.path.endswith(SUPPORTED_FILE_EXTENSIONS):
+        if not _is_supported_file(file_content.path):
             return False
             
         return True
@@ -922,19 +1866,9 @@ IMPORTANT GUIDELINES:
         Returns:
             Commit message string
         """
-        # Create a concise message about what's changing
-        commit_title = f"Improve {file_path}"
-        
-        # Add details about the changes
-        commit_body = "RepoSage: AI-suggested improvements\n\n"
-        commit_body += f"Changes to {file_path}:\n"
-        
-        # Add each specific change to the commit message
-        for idx, suggestion in enumerate(suggested_changes, 1):
-            if 'explanation' in suggestion:
-                commit_body += f"- {suggestion['explanation']}\n"
-        
-        return f"{commit_title}\n\n{commit_body}"
+        # The title and header are fixed; only the file path and explanations vary
+        explanations = "".join(f"- {suggestion['explanation']}\n" for suggestion in suggested_changes if 'explanation' in suggestion)
+        return f"Improve {file_path}\n\n{self._COMMIT_HEADER}{file_path}:\n{explanations}"
     
     def generate_commit_messages(self, changes_list):
         """Generate commit messages for all changes.
@@ -990,8 +1924,8 @@ IMPORTANT GUIDELINES:
                 serializable_analyses.append(serializable_analysis)
             
             # Write to file
-            with open(output_file, 'w') as f:
-                json.dump(serializable_analyses, f, indent=2)
+            with open(output_file, 'wb') as f:
+                f.write(orjson.dumps(serializable_analyses, option=orjson.OPT_INDENT_2))
             
             logger.info(f"Saved analyses to {output_file}")
             return True
@@ -1002,14 +1936,24 @@ IMPORTANT GUIDELINES:
     def read_changelog(self):
         """Read the existing changelog file or create it if it doesn't exist.
         
+        The changelog is fetched and decoded at most once per instance; every
+        file analysis shares the cached text.
+        
         Returns:
             The content of the changelog file
         """
+        with self._changelog_lock:
+            if self._changelog_content is None:
+                self._changelog_content = self._load_changelog()
+            return self._changelog_content
+
+    def _load_changelog(self):
+        """Fetch the changelog from the base branch, creating a default one if missing."""
         changelog_path = "CHANGELOG.md"
         try:
             # Try to get the existing changelog
-            file_content = self.repo.get_contents(changelog_path, ref=self.base_branch)
-            content = base64.b64decode(file_content.content).decode('utf-8')
+            file_content = self._get_contents(changelog_path, ref=self.base_branch)
+            content = _decode_content(file_content)
             logger.info(f"Read existing changelog: {len(content)} characters")
             return content
         except Exception as e:
@@ -1017,27 +1961,14 @@ IMPORTANT GUIDELINES:
             logger.info(f"Changelog not found or couldn't be read: {str(e)}")
             
             # Create a default changelog
-            default_content = """# Changelog
-
-All notable changes to this project will be documented in this file.
-
-The format is based on [Keep a Changelog](https://keepachangelog.com/en/1.0.0/),
-and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0.html).
-
-## [Unreleased]
-
-### Added
-
-### Changed
-
-### Fixed
-
-"""
+            default_content = DEFAULT_CHANGELOG
             # If we're not in dry run mode, create the file
-            if not hasattr(self, 'dry_run') or not self.dry_run:
+            if not self.dry_run:
                 try:
                     # Check if we're using direct commits or PRs
-                    branch = self.base_branch if hasattr(self, 'direct_commit') and self.direct_commit else self.branch_name
+                    branch = self.base_branch if self.direct_commit else self.branch_name
+                    if branch == self.branch_name and self._branch_future is not None:
+                        self._branch_future.result()
                     
                     # Create the file
                     self.repo.create_file(
@@ -1091,12 +2022,7 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
                             explanation = suggestion['explanation']
                             entry = f"- {file_path}: {explanation}"
                             
-                            if any(word in explanation.lower() for word in ['fix', 'bug', 'issue', 'error', 'crash']):
-                                new_entries["fixed"].append(entry)
-                            elif any(word in explanation.lower() for word in ['add', 'new', 'implement', 'create']):
-                                new_entries["added"].append(entry)
-                            else:
-                                new_entries["changed"].append(entry)
+                            new_entries[_categorize_explanation(explanation)].append(entry)
             
             # Create the new changelog content
             new_content = f"## [{today}]\n\n"
@@ -1129,8 +2055,7 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
                 return False, "No significant changes to add to changelog"
             
             # Insert the new content after the Unreleased section
-            unreleased_pattern = r"## \[Unreleased\].*?(?=##|\Z)"
-            match = re.search(unreleased_pattern, current_changelog, re.DOTALL)
+            match = UNRELEASED_SECTION_PATTERN.search(current_changelog)
             
             if match:
                 unreleased_section = match.group(0)
@@ -1148,10 +2073,10 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
             changelog_path = "CHANGELOG.md"
             try:
                 # Get the current file
-                file_content = self.repo.get_contents(changelog_path, ref=self.base_branch)
+                file_content = self._get_contents(changelog_path, ref=self.base_branch)
                 
                 # The branch to commit to depends on the mode
-                branch = self.base_branch if hasattr(self, 'direct_commit') and self.direct_commit else self.branch_name
+                branch = self.base_branch if self.direct_commit else self.branch_name
                 
                 # Update the file
                 self.repo.update_file(
@@ -1162,12 +2087,13 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
                     branch=branch
                 )
                 logger.info(f"Updated changelog in {branch}")
+                self._changelog_content = updated_changelog
                 return True, f"Updated changelog with changes from {today}"
             except Exception as e:
                 # If the file doesn't exist, create it
                 if "not found" in str(e).lower():
                     try:
-                        branch = self.base_branch if hasattr(self, 'direct_commit') and self.direct_commit else self.branch_name
+                        branch = self.base_branch if self.direct_commit else self.branch_name
                         self.repo.create_file(
                             changelog_path,
                             f"Create changelog with changes from {today}",
@@ -1175,6 +2101,7 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
                             branch=branch
                         )
                         logger.info(f"Created changelog in {branch}")
+                        self._changelog_content = updated_changelog
                         return True, f"Created changelog with changes from {today}"
                     except Exception as create_err:
                         logger.error(f"Failed to create changelog: {str(create_err)}")
@@ -1242,8 +2169,8 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
             
             # Check if the test file already exists
             try:
-                existing_test_file = self.repo.get_contents(test_file_path, ref=self.base_branch)
-                existing_test_content = base64.b64decode(existing_test_file.content).decode('utf-8')
+                existing_test_file = self._get_contents(test_file_path, ref=self.base_branch)
+                existing_test_content = _decode_content(existing_test_file)
                 
                 # Append the new tests to the existing test file
                 # Add a comment to separate the new tests
@@ -1318,6 +2245,11 @@ def main():
         parser.add_argument('--max-workers', type=int, help='Maximum number of parallel workers for file analysis')
         parser.add_argument('--sequential', action='store_true', help='Run analysis sequentially instead of in parallel (useful for testing)')
         parser.add_argument('--use-pr', action='store_true', help='Create pull requests instead of committing directly to the base branch')
+        parser.add_argument('--cache-file', help='JSON file recording analyzed files so unchanged files are skipped on later runs')
+        parser.add_argument('--requests-per-minute', type=int, help='Spread OpenRouter calls to stay under this many requests per minute')
+        parser.add_argument('--stream', action='store_true', help='Stream model responses instead of waiting for each complete response')
+        parser.add_argument('--local-clone', action='store_true', help='Read file contents from a shallow clone instead of one API request per file')
+        parser.add_argument('--batch-bytes', type=int, default=0, help=f'Pack small files into shared analysis requests of up to this many bytes, e.g. {MAX_BATCH_BYTES} (default: 0, one request per file)')
         
         # Parse arguments
         args = parser.parse_args()
@@ -1330,16 +2262,24 @@ def main():
             model=args.model,
             base_branch=args.base_branch,
             description=args.description,
-            use_parallel=not args.sequential
+            use_parallel=not args.sequential,
+            cache_file=args.cache_file,
+            batch_bytes=args.batch_bytes,
+            stream_responses=args.stream,
+            requests_per_minute=args.requests_per_minute,
+            local_clone=args.local_clone
         )
         
         # Run the bot with additional options
-        changes_list = bot.run(
-            dry_run=args.dry_run,
-            output_file=args.output_file,
-            max_workers=args.max_workers,
-            direct_commit=not args.use_pr
-        )
+        try:
+            changes_list = bot.run(
+                dry_run=args.dry_run,
+                output_file=args.output_file,
+                max_workers=args.max_workers,
+                direct_commit=not args.use_pr
+            )
+        finally:
+            bot.close()
         
         # Save changes to file if changes were made
         if changes_list:
@@ -8,11 +8,9 @@ import os
 import sys
 import argparse
 import logging
-import json
-import tempfile
-import subprocess
-from pathlib import Path
-from typing import List, Dict, Any, Optional
+import difflib
+import orjson
+from typing import Iterable, Iterator
 
 # Configure logging
 logging.basicConfig(
@@ -21,49 +19,58 @@ logging.basicConfig(
 )
 logger = logging.getLogger('RepoSageDiff')
 
-def save_temp_file(content: str, original_path: str) -> str:
-    """Save content to a temporary file with the same extension as the original."""
-    ext = Path(original_path).suffix
-    with tempfile.NamedTemporaryFile(suffix=ext, delete=False, mode='w') as temp:
-        temp.write(content)
-        return temp.name
+# Colors of git's default diff output: file headers, then by line prefix
+HEADER_COLOR = '\033[1m'
+DIFF_COLORS = (
+    ('@@', '\033[36m'),
+    ('+', '\033[32m'),
+    ('-', '\033[31m'),
+)
+COLOR_RESET = '\033[m'
+# Marker git prints after a diff line that has no trailing newline
+NO_NEWLINE_MARKER = '\\ No newline at end of file'
+
+def colorize_diff_lines(lines: Iterable[str]) -> Iterator[str]:
+    """Color unified diff lines the way git diff --color does.
+    
+    Lines starting with --- or +++ are file headers only before the first
+    hunk; inside a hunk they are removed or added lines.
+    """
+    in_hunk = False
+    for line in lines:
+        if not in_hunk and line.startswith(('---', '+++')):
+            yield f"{HEADER_COLOR}{line}{COLOR_RESET}"
+            continue
+        in_hunk = in_hunk or line.startswith('@@')
+        for prefix, color in DIFF_COLORS:
+            if line.startswith(prefix):
+                line = f"{color}{line}{COLOR_RESET}"
+                break
+        yield line
 
 def generate_diff(original_content: str, modified_content: str, file_path: str) -> str:
     """Generate a unified diff between original and modified content."""
     if original_content == modified_content:
         return f"No changes for {file_path}"
     
-    # Save contents to temporary files
-    orig_file = save_temp_file(original_content, file_path)
-    mod_file = save_temp_file(modified_content, file_path)
-    
-    try:
-        # Generate diff using git diff
-        cmd = ["git", "diff", "--no-index", "--color=always", orig_file, mod_file]
-        result = subprocess.run(cmd, capture_output=True, text=True)
-        
-        # Clean up the diff output to make it more readable
-        diff_lines = result.stdout.split('\n')
-        # Remove temp file paths from the diff
-        clean_diff = []
-        for line in diff_lines:
-            if orig_file in line:
-                line = line.replace(orig_file, f"a/{file_path}")
-            if mod_file in line:
-                line = line.replace(mod_file, f"b/{file_path}")
-            clean_diff.append(line)
-        
-        return '\n'.join(clean_diff)
-    finally:
-        # Clean up temporary files
-        os.unlink(orig_file)
-        os.unlink(mod_file)
+    diff_lines = []
+    for line in difflib.unified_diff(
+        original_content.splitlines(keepends=True),
+        modified_content.splitlines(keepends=True),
+        fromfile=f"a/{file_path}",
+        tofile=f"b/{file_path}"
+    ):
+        if line.endswith('\n'):
+            diff_lines.append(line[:-1])
+        else:
+            diff_lines.extend((line, NO_NEWLINE_MARKER))
+    return '\n'.join(colorize_diff_lines(diff_lines))
 
 def process_changes_file(changes_file: str) -> None:
     """Process a JSON file containing RepoSage changes and generate diffs."""
     try:
-        with open(changes_file, 'r') as f:
-            changes = json.load(f)
+        with open(changes_file, 'rb') as f:
+            changes = orjson.loads(f.read())
         
         if not changes:
             logger.error("No changes found in the file")
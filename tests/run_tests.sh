@@ -9,7 +9,7 @@ export GITHUB_REPOSITORY="test_user/test_repo"
 export OPENROUTER_API_KEY="test_openrouter_api_key"
 
 echo "Running unit tests..."
-python -m unittest test_bot.py
+python -m unittest test_bot.py test_generate_diff.py
 
 echo -e "\nRunning integration tests..."
 python -m unittest integration_test.py
@@ -4,14 +4,18 @@ import unittest
 from pathlib import Path
 import tempfile
 import base64
-import json
-from unittest.mock import patch, Mock, MagicMock
+import orjson
+import subprocess
+import concurrent.futures
+from unittest.mock import patch, Mock, MagicMock, ANY
 
 # Add the repo-sage-action directory to the Python path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'repo-sage-action')))
 
-from bot import RepoSage
-from test_utils import create_mock_file_content, mock_openrouter_response, setup_mock_github_repo
+from bot import RepoSage, RateLimiter, GitBlobReader, GITHUB_POOL_SIZE, OPENROUTER_POOL_SIZE, ANALYSIS_INSTRUCTIONS, _apply_changes, _categorize_explanation, _code_fence, _find_json_object, _pack_batches
+from github import GithubException
+from github.GitTreeElement import GitTreeElement
+from test_utils import create_mock_file_content, mock_openrouter_response, setup_mock_github_repo, message_text
 
 class TestRepoSage(unittest.TestCase):
     """Test suite for the RepoSage bot."""
@@ -46,10 +50,10 @@ class TestRepoSage(unittest.TestCase):
         # Set up mock response for OpenRouter API
         self.mock_response = MagicMock()
         self.mock_response.status_code = 200
-        self.mock_response.json.return_value = {
+        self.response_data = {
             'choices': [{
                 'message': {
-                    'content': json.dumps({
+                    'content': orjson.dumps({
                         'analysis': {
                             'code_quality': 'Good code quality',
                             'best_practices': 'Follows best practices',
@@ -62,11 +66,14 @@ class TestRepoSage(unittest.TestCase):
                             'explanation': 'Better function name'
                         }],
                         'summary': 'Improved function naming'
-                    })
+                    }).decode()
                 }
             }]
         }
-        self.mock_requests.post.return_value = self.mock_response
+        self.mock_response.content = orjson.dumps(self.response_data)
+        # OpenRouter calls go through the bot's shared requests session
+        self.mock_session = self.mock_requests.Session.return_value
+        self.mock_session.post.return_value = self.mock_response
 
         # Create the bot with mocked dependencies
         with patch('bot.Github') as mock_github_class:
@@ -103,7 +110,8 @@ class TestRepoSage(unittest.TestCase):
         )
         
         # Verify GitHub client was initialized
-        self.mock_github.assert_called_once_with('fake_github_token')
+        self.mock_github.assert_called_once_with(auth=ANY, pool_size=GITHUB_POOL_SIZE)
+        self.assertEqual(self.mock_github.call_args[1]['auth'].token, 'fake_github_token')
         self.mock_github.return_value.get_repo.assert_called_once_with('user/repo')
         
         # Verify attributes were set correctly
@@ -131,7 +139,8 @@ class TestRepoSage(unittest.TestCase):
         )
         
         # Verify GitHub client was initialized again
-        self.mock_github.assert_called_once_with('fake_github_token')
+        self.mock_github.assert_called_once_with(auth=ANY, pool_size=GITHUB_POOL_SIZE)
+        self.assertEqual(self.mock_github.call_args[1]['auth'].token, 'fake_github_token')
         self.mock_github.return_value.get_repo.assert_called_once_with('user/repo')
         
         # Verify attributes were set correctly including description
@@ -149,15 +158,22 @@ class TestRepoSage(unittest.TestCase):
         mock_py_file = create_mock_file_content('test.py')
         mock_js_file = create_mock_file_content('test.js')
         mock_txt_file = create_mock_file_content('test.txt')  # Should be filtered out
+        mock_large_file = create_mock_file_content('large.py', size=200 * 1024)  # Too large
+        mock_ignored_file = create_mock_file_content('node_modules/lib.js')  # Ignored directory
         mock_dir = MagicMock()
-        mock_dir.type = "dir"
+        mock_dir.type = "tree"
         mock_dir.path = "test_dir"
+        for blob in (mock_py_file, mock_js_file, mock_txt_file, mock_large_file, mock_ignored_file):
+            blob.type = "blob"
         
-        # Set up mock responses for get_contents
-        self.mock_repo.get_contents.side_effect = [
-            [mock_dir, mock_txt_file],  # First call returns root contents
-            [mock_py_file, mock_js_file]  # Second call returns directory contents
+        # The whole repository is listed by a single recursive tree call
+        self.mock_repo.get_git_tree.return_value.tree = [
+            mock_dir, mock_txt_file, mock_py_file, mock_js_file, mock_large_file, mock_ignored_file
         ]
+        self.mock_repo.get_git_tree.return_value.truncated = False
+        head = self.mock_repo.get_branch.return_value.commit
+        head.sha = "base-commit-sha"
+        head.commit.tree.sha = "base-tree-sha"
         
         # Create bot and fetch files
         bot = RepoSage(
@@ -175,6 +191,49 @@ class TestRepoSage(unittest.TestCase):
         self.assertIn(mock_py_file, files)
         self.assertIn(mock_js_file, files)
         self.assertNotIn(mock_txt_file, files)
+        self.mock_repo.get_git_tree.assert_called_once_with("base-tree-sha", recursive=True)
+        self.mock_repo.get_contents.assert_not_called()
+        
+        # New branches start from the commit the files were listed at
+        self.mock_repo.get_branch.reset_mock()
+        bot.create_branch()
+        self.mock_repo.create_git_ref.assert_called_once_with(
+            ref=f"refs/heads/{bot.branch_name}", sha="base-commit-sha"
+        )
+        self.mock_repo.get_branch.assert_not_called()
+
+    def test_fetch_repo_files_walks_truncated_tree(self):
+        """Test that a truncated tree listing falls back to a directory walk."""
+        def element(path, type, sha, size=100):
+            return GitTreeElement(MagicMock(), {}, {'path': path, 'type': type, 'sha': sha, 'size': size, 'mode': '100644'})
+        
+        subtrees = {
+            'root-tree': [element('main.py', 'blob', 'main-sha'), element('pkg', 'tree', 'pkg-tree'), element('node_modules', 'tree', 'ignored-tree')],
+            'pkg-tree': [element('util.js', 'blob', 'util-sha'), element('sub', 'tree', 'sub-tree')],
+            'sub-tree': [element('deep.py', 'blob', 'deep-sha')],
+        }
+        
+        def get_git_tree(sha, recursive=False):
+            tree = MagicMock()
+            tree.truncated = recursive
+            tree.tree = [] if recursive else subtrees[sha]
+            return tree
+        self.mock_repo.get_git_tree.side_effect = get_git_tree
+        self.mock_repo.get_branch.return_value.commit.commit.tree.sha = 'root-tree'
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        files = bot.fetch_repo_files()
+        
+        self.assertEqual([(f.path, f.sha) for f in files], [('main.py', 'main-sha'), ('pkg/util.js', 'util-sha'), ('pkg/sub/deep.py', 'deep-sha')])
+        # Ignored directories are never listed
+        self.assertNotIn('ignored-tree', [c[0][0] for c in self.mock_repo.get_git_tree.call_args_list])
 
     def test_analyze_file(self):
         """Test file analysis with OpenRouter API."""
@@ -193,15 +252,29 @@ class TestRepoSage(unittest.TestCase):
         result = bot.analyze_file(mock_file)
         
         # Verify API was called correctly
-        self.mock_requests.post.assert_called_once()
-        call_args = self.mock_requests.post.call_args
+        self.mock_session.post.assert_called_once()
+        call_args = self.mock_session.post.call_args
         self.assertEqual(call_args[0][0], "https://openrouter.ai/api/v1/chat/completions")
         
+        # The shared instructions come first and are marked cacheable; the file comes last
+        user_parts = call_args[1]['json']['messages'][1]['content']
+        self.assertEqual(user_parts[0]['text'], ANALYSIS_INSTRUCTIONS)
+        self.assertEqual(user_parts[0]['cache_control'], {"type": "ephemeral"})
+        self.assertNotIn('cache_control', user_parts[-1])
+        self.assertIn('test.py', user_parts[-1]['text'])
+        self.assertIn('```python\n', user_parts[-1]['text'])
+        
+        # Requests identify the app to OpenRouter
+        session_headers = [c[0][0] for c in self.mock_session.headers.update.call_args_list]
+        self.assertIn('RepoSage', [headers.get('X-Title') for headers in session_headers])
+        
         # Verify result structure
         self.assertIsNotNone(result)
         self.assertEqual(result['file_path'], 'test.py')
         self.assertIn('analysis', result)
         self.assertIn('suggested_changes', result['analysis'])
+        self.assertEqual(result['original_content'], 'def old_function():\n    pass')
+        self.assertEqual(result['content_sha'], mock_file.sha)
         
         # Reset mock
         self.mock_requests.reset_mock()
@@ -220,14 +293,14 @@ class TestRepoSage(unittest.TestCase):
         result_with_desc = bot_with_desc.analyze_file(mock_file)
         
         # Verify API was called correctly with description
-        self.mock_requests.post.assert_called_once()
-        call_args = self.mock_requests.post.call_args
+        self.mock_session.post.assert_called_once()
+        call_args = self.mock_session.post.call_args
         self.assertEqual(call_args[0][0], "https://openrouter.ai/api/v1/chat/completions")
         
         # Check if the description was included in the prompt
         request_json = call_args[1]['json']
         # The description should be in the user message (index 1), not the system message (index 0)
-        prompt_content = request_json['messages'][1]['content']
+        prompt_content = message_text(request_json['messages'][1])
         self.assertIn(description, prompt_content)
         
         # Verify result structure
@@ -236,6 +309,108 @@ class TestRepoSage(unittest.TestCase):
         self.assertIn('analysis', result_with_desc)
         self.assertIn('suggested_changes', result_with_desc['analysis'])
 
+    def test_analyze_file_fetches_tree_blob(self):
+        """Test that files listed from the tree have their raw blob fetched lazily."""
+        tree_element = MagicMock(spec=GitTreeElement)
+        tree_element.path = 'test.py'
+        tree_element.sha = 'blob_sha'
+        self.mock_session.get.return_value.content = b'def old_function():\n    pass\n'
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        result = bot.analyze_file(tree_element)
+        
+        self.mock_session.get.assert_called_once_with(f"https://api.github.com/repos/{self.repo_name}/git/blobs/blob_sha")
+        self.mock_repo.get_git_blob.assert_not_called()
+        self.assertIsNotNone(result)
+        self.assertEqual(result['file_path'], 'test.py')
+        self.assertEqual(result['original_content'], 'def old_function():\n    pass\n')
+
+    def test_analyze_file_reads_blob_from_local_clone(self):
+        """Test that blobs are read from a local clone instead of the API."""
+        with tempfile.TemporaryDirectory() as origin:
+            git = ["git", "-C", origin, "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            subprocess.run(git[:3] + ["init", "-q", "-b", "main"], check=True)
+            Path(origin, 'test.py').write_text('def old_function():\n    pass\n')
+            subprocess.run(git + ["add", "test.py"], check=True)
+            subprocess.run(git + ["commit", "-q", "-m", "Initial commit"], check=True)
+            blob_sha = subprocess.run(
+                git[:3] + ["rev-parse", "HEAD:test.py"], stdout=subprocess.PIPE, text=True, check=True
+            ).stdout.strip()
+            
+            reader = GitBlobReader(f"file://{origin}", "main")
+        try:
+            self.assertEqual(reader.read(blob_sha), b'def old_function():\n    pass\n')
+            self.assertIsNone(reader.read('0' * 40))
+            
+            bot = RepoSage(
+                github_token=self.github_token, 
+                repo_name=self.repo_name, 
+                openrouter_api_key=self.openrouter_api_key, 
+                model=self.model, 
+                base_branch=self.base_branch, 
+                use_parallel=False
+            )
+            bot._blob_reader = reader
+            tree_element = MagicMock(spec=GitTreeElement)
+            tree_element.path = 'test.py'
+            tree_element.sha = blob_sha
+            result = bot.analyze_file(tree_element)
+            
+            self.mock_session.get.assert_not_called()
+            self.assertEqual(result['original_content'], 'def old_function():\n    pass\n')
+        finally:
+            reader.close()
+        self.assertFalse(os.path.exists(reader.workdir))
+
+    def test_read_blob_falls_back_to_api_when_clone_dies(self):
+        """Test that blobs are downloaded from the API once the cat-file process is gone."""
+        with tempfile.TemporaryDirectory() as origin:
+            git = ["git", "-C", origin, "-c", "user.name=test", "-c", "user.email=test@example.com"]
+            subprocess.run(git[:3] + ["init", "-q", "-b", "main"], check=True)
+            Path(origin, 'test.py').write_text('def old_function():\n    pass\n')
+            subprocess.run(git + ["add", "test.py"], check=True)
+            subprocess.run(git + ["commit", "-q", "-m", "Initial commit"], check=True)
+            reader = GitBlobReader(f"file://{origin}", "main")
+
+        reader._process.kill()
+        reader._process.wait()
+        with self.assertRaises(OSError):
+            reader.read('0' * 40)
+
+        self.bot._blob_reader = reader
+        self.mock_session.get.return_value.content = b'def old_function():\n    pass\n'
+        tree_element = MagicMock(spec=GitTreeElement)
+        tree_element.sha = 'blob_sha'
+
+        self.assertEqual(self.bot._read_blob(tree_element), b'def old_function():\n    pass\n')
+        self.mock_session.get.assert_called_once_with(f"https://api.github.com/repos/{self.repo_name}/git/blobs/blob_sha")
+        self.assertIsNone(self.bot._blob_reader)
+        self.assertFalse(os.path.exists(reader.workdir))
+
+    @patch('bot.subprocess.run')
+    def test_clone_keeps_token_out_of_command_line(self, mock_run):
+        """Test that the clone sends the token in a header and never reports it."""
+        mock_run.return_value = MagicMock(returncode=128, stderr="fatal: could not read from secret_token")
+
+        with self.assertRaises(RuntimeError) as context:
+            GitBlobReader("https://github.com/user/repo.git", "main", token="secret_token")
+
+        self.assertNotIn("secret_token", str(context.exception))
+        command = mock_run.call_args[0][0]
+        self.assertNotIn("secret_token", " ".join(command))
+        env = mock_run.call_args[1]['env']
+        index = int(env["GIT_CONFIG_COUNT"]) - 1
+        self.assertEqual(env[f"GIT_CONFIG_KEY_{index}"], "http.extraHeader")
+        credentials = base64.b64encode(b"x-access-token:secret_token").decode()
+        self.assertEqual(env[f"GIT_CONFIG_VALUE_{index}"], f"Authorization: Basic {credentials}")
+
     def test_implement_changes(self):
         """Test implementing suggested changes."""
         # Create mock file analysis
@@ -276,6 +451,17 @@ class TestRepoSage(unittest.TestCase):
         self.assertEqual(result['file_path'], 'test.py')
         self.assertEqual(result['changes_applied'], 1)
         self.assertEqual(result['content'], 'def improved_function():\n    pass')
+        # Changes are committed later, all at once
+        self.mock_repo.update_file.assert_not_called()
+        
+        # Content handed on by the analysis is used without fetching the file again
+        self.mock_repo.get_contents.reset_mock()
+        file_analysis['original_content'] = 'def old_function():\n    return 1'
+        file_analysis['content_sha'] = 'analyzed_sha'
+        result = bot.implement_changes(file_analysis)
+        self.assertEqual(result['content'], 'def improved_function():\n    return 1')
+        self.mock_repo.get_contents.assert_not_called()
+        self.assertEqual(result['sha'], 'analyzed_sha')
 
     def test_create_branch(self):
         """Test branch creation."""
@@ -327,6 +513,120 @@ class TestRepoSage(unittest.TestCase):
         # Verify changes were committed
         self.assertTrue(result)
         self.mock_repo.update_file.assert_called_once()
+        
+        # A recorded base blob SHA is used directly, and refreshed only on a conflict
+        self.mock_repo.reset_mock()
+        file_changes['sha'] = 'base_sha'
+        self.assertTrue(bot.commit_changes(file_changes))
+        self.mock_repo.get_contents.assert_not_called()
+        self.assertEqual(self.mock_repo.update_file.call_args[0][3], 'base_sha')
+        
+        self.mock_repo.reset_mock()
+        self.mock_repo.update_file.side_effect = [GithubException(409, {'message': 'sha mismatch'}, None), None]
+        self.assertTrue(bot.commit_changes(file_changes))
+        self.assertEqual([c[0][3] for c in self.mock_repo.update_file.call_args_list], ['base_sha', mock_file.sha])
+
+    def test_commit_changes_directly(self):
+        """Test committing changes and their tests straight to the base branch."""
+        changes_list = [{
+            'file_path': 'test.py',
+            'content': 'def improved_function():\n    pass',
+            'original_content': 'def old_function():\n    pass',
+            'changes_applied': 1,
+            'analysis': {
+                'suggested_changes': [{
+                    'original_code': 'def old_function():',
+                    'improved_code': 'def improved_function():',
+                    'explanation': 'Better function name',
+                    'test_code': 'def test_improved_function():\n    assert True'
+                }],
+                'summary': 'Improved function naming'
+            }
+        }]
+        
+        # No test file exists yet
+        self.mock_repo.get_contents.side_effect = Exception("Not found")
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        bot.mock_test_run = (True, "All tests passed")
+        
+        with patch.object(bot, 'update_changelog', return_value=(True, "Updated changelog")):
+            success, message = bot.commit_changes_directly(changes_list)
+        
+        self.assertTrue(success)
+        self.assertEqual(message, f"Successfully committed 1 changes to {self.base_branch}")
+        
+        # The test file is built once, for both the test run and the commit
+        self.mock_repo.get_contents.assert_called_once_with('test_test.py', ref=self.base_branch)
+        
+        # Source and test files are written with one tree and one commit
+        self.mock_repo.create_git_tree.assert_called_once()
+        elements = self.mock_repo.create_git_tree.call_args[0][0]
+        self.assertEqual(sorted(e._identity['path'] for e in elements), ['test.py', 'test_test.py'])
+        self.mock_repo.create_git_commit.assert_called_once()
+        self.mock_repo.get_git_ref.return_value.edit.assert_called_once_with(
+            self.mock_repo.create_git_commit.return_value.sha
+        )
+        self.mock_repo.update_file.assert_not_called()
+        self.mock_repo.create_file.assert_not_called()
+
+    def test_commit_changes_to_branch(self):
+        """Test committing every change to the feature branch in one commit."""
+        changes_list = [{
+            'file_path': f'module_{i}.py',
+            'content': 'def improved_function():\n    pass',
+            'changes_applied': 1,
+            'analysis': {
+                'suggested_changes': [{'explanation': 'Better function name'}],
+                'summary': 'Improved function naming'
+            }
+        } for i in range(3)]
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        bot.implement_tests = lambda file_path, suggested_changes: {}
+        
+        self.assertTrue(bot.commit_changes_to_branch(changes_list))
+        
+        self.mock_repo.get_git_ref.assert_called_once_with(f"heads/{bot.branch_name}")
+        self.mock_repo.create_git_tree.assert_called_once()
+        elements = self.mock_repo.create_git_tree.call_args[0][0]
+        self.assertEqual(sorted(e._identity['path'] for e in elements), ['module_0.py', 'module_1.py', 'module_2.py'])
+        self.assertTrue(self.mock_repo.create_git_commit.call_args[0][0].startswith("RepoSage: Improve 3 files"))
+        self.mock_repo.update_file.assert_not_called()
+
+    def test_commit_keeps_file_modes(self):
+        """Test that committed files keep the mode they were listed with."""
+        script = create_mock_file_content('run.py')
+        script.mode = "100755"
+        script.type = "blob"
+        self.mock_repo.get_git_tree.return_value.tree = [script]
+        self.mock_repo.get_git_tree.return_value.truncated = False
+        bot = RepoSage(
+            github_token=self.github_token,
+            repo_name=self.repo_name,
+            openrouter_api_key=self.openrouter_api_key
+        )
+        bot.fetch_repo_files()
+        
+        bot._commit_files({'run.py': 'print("hi")', 'new.py': 'pass'}, "Improve files", bot.branch_name)
+        
+        elements = self.mock_repo.create_git_tree.call_args[0][0]
+        modes = {e._identity['path']: e._identity['mode'] for e in elements}
+        self.assertEqual(modes, {'run.py': '100755', 'new.py': '100644'})
 
     def test_create_pull_request(self):
         """Test creating a pull request."""
@@ -365,9 +665,263 @@ class TestRepoSage(unittest.TestCase):
         self.assertIsNotNone(result)
         self.mock_repo.create_pull.assert_called_once()
         call_args = self.mock_repo.create_pull.call_args
-        self.assertTrue('RepoSage: Code improvements' in call_args[1]['title'])
+        # A single file gets the same title and body as an individual pull request
+        self.assertEqual(call_args[1]['title'], 'RepoSage: Improve test.py')
         self.assertTrue('AI-Suggested Code Improvements' in call_args[1]['body'])
-        self.assertTrue('test.py' in call_args[1]['body'])
+        self.assertTrue('improvements for `test.py`' in call_args[1]['body'])
+        self.assertNotIn('---', call_args[1]['body'])
+        
+        # Several files get the combined heading
+        bot.create_pull_request(changes + [dict(changes[0], file_path='other.py')])
+        call_args = self.mock_repo.create_pull.call_args
+        self.assertTrue('RepoSage: Code improvements (2 files)' in call_args[1]['title'])
+        self.assertTrue('other.py' in call_args[1]['body'])
+
+    def test_create_pull_request_truncates_long_body(self):
+        """A body over GitHub's size limit lists the files that fit and counts the rest."""
+        changes = [{
+            'file_path': f'module_{i}.py',
+            'content': 'pass',
+            'analysis': {
+                'suggested_changes': [{'explanation': 'x' * 1000}],
+                'summary': 'Improved module'
+            }
+        } for i in range(100)]
+
+        bot = RepoSage(
+            github_token=self.github_token,
+            repo_name=self.repo_name,
+            openrouter_api_key=self.openrouter_api_key
+        )
+        bot.create_pull_request(changes)
+
+        body = self.mock_repo.create_pull.call_args[1]['body']
+        self.assertLessEqual(len(body), 65536)
+        self.assertIn('module_0.py', body)
+        self.assertNotIn('module_99.py', body)
+        self.assertRegex(body, r"…and \d+ more changed files")
+
+    def test_streamed_response(self):
+        """Test collecting a streamed completion into a regular response."""
+        stream_response = MagicMock()
+        stream_response.status_code = 200
+        stream_response.iter_lines.return_value = [
+            b": OPENROUTER PROCESSING",
+            b"",
+            b'data: {"choices": [{"delta": {"role": "assistant", "content": "Hello, "}}]}',
+            b'data: {"choices": [{"delta": {"content": "world"}}]}',
+            b"data: [DONE]",
+            b'data: {"choices": [{"delta": {"content": "ignored"}}]}'
+        ]
+        self.mock_session.post.return_value = stream_response
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False,
+            stream_responses=True
+        )
+        response = bot.call_openrouter_api("Say hello")
+        
+        self.assertEqual(response['choices'][0]['message']['content'], "Hello, world")
+        call_args = self.mock_session.post.call_args
+        self.assertTrue(call_args[1]['stream'])
+        self.assertTrue(call_args[1]['json']['stream'])
+        stream_response.close.assert_called_once()
+
+    def test_openrouter_retries_rate_limited_calls(self):
+        """Test that 429 and 5xx responses are retried, honouring Retry-After."""
+        rate_limited = MagicMock()
+        rate_limited.status_code = 429
+        rate_limited.headers = {'Retry-After': '7'}
+        server_error = MagicMock()
+        server_error.status_code = 502
+        server_error.headers = {}
+        self.mock_session.post.side_effect = [rate_limited, server_error, self.mock_response]
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        with patch('bot.time.monotonic', return_value=100.0), patch('bot.time.sleep') as mock_sleep:
+            response = bot.call_openrouter_api("Analyze this")
+        
+        self.assertEqual(response, self.response_data)
+        self.assertEqual(self.mock_session.post.call_count, 3)
+        delays = [c[0][0] for c in mock_sleep.call_args_list]
+        self.assertGreaterEqual(delays[0], 7)  # Retry-After
+        self.assertLess(delays[0], 8)
+        self.assertGreaterEqual(delays[1], 2)  # Backoff for the second attempt
+        self.assertLess(delays[1], 3)
+
+    def test_rate_limiter_spaces_calls(self):
+        """Test that the rate limiter releases calls at a steady interval."""
+        limiter = RateLimiter(requests_per_minute=30)
+        with patch('bot.time.monotonic', return_value=100.0), patch('bot.time.sleep') as mock_sleep:
+            for _ in range(3):
+                limiter.acquire()
+        
+        # The first call goes straight through; the next ones wait two seconds more each
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [2.0, 4.0])
+        
+        # Without a limit, callers only wait out a pause
+        limiter = RateLimiter()
+        with patch('bot.time.monotonic', return_value=100.0), patch('bot.time.sleep') as mock_sleep:
+            limiter.acquire()
+            limiter.pause(5)
+            limiter.acquire()
+            limiter.acquire()
+        self.assertEqual([c[0][0] for c in mock_sleep.call_args_list], [5.0, 5.0])
+
+    def test_get_contents_revalidates_cached_file(self):
+        """Test that repeated file fetches revalidate the cached copy by ETag."""
+        mock_file = create_mock_file_content('test.py')
+        self.mock_repo.get_contents.return_value = mock_file
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        self.assertIs(bot._get_contents('test.py', ref='main'), mock_file)
+        self.assertIs(bot._get_contents('test.py', ref='main'), mock_file)
+        
+        # The second fetch is a conditional request on the cached object
+        self.mock_repo.get_contents.assert_called_once_with('test.py', ref='main')
+        mock_file.update.assert_called_once()
+        
+        # Another ref is a separate entry
+        bot._get_contents('test.py', ref='feature')
+        self.assertEqual(self.mock_repo.get_contents.call_count, 2)
+
+    def test_analyze_files_batched(self):
+        """Test packing small files into shared analysis requests."""
+        small_files = [create_mock_file_content(path, size=100) for path in ('a.py', 'b.py')]
+        large_file = create_mock_file_content('c.py', size=200)
+        
+        entry = orjson.loads(self.response_data['choices'][0]['message']['content'])
+        batch_response = MagicMock()
+        batch_response.status_code = 200
+        batch_response.content = orjson.dumps({
+            'choices': [{
+                'message': {
+                    'content': orjson.dumps({'results': [
+                        dict(entry, file_path='a.py'),
+                        dict(entry, file_path='b.py'),
+                        dict(entry, file_path='not_requested.py')
+                    ]}).decode()
+                }
+            }]
+        })
+        
+        def post(url, json, **kwargs):
+            prompt = message_text(json['messages'][1])
+            return batch_response if '=== FILE' in prompt else self.mock_response
+        self.mock_session.post.side_effect = post
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        results = bot.analyze_files_batched(small_files + [large_file], max_batch_bytes=250)
+        
+        # The two small files share one request; the large one gets its own
+        self.assertEqual(self.mock_session.post.call_count, 2)
+        self.assertEqual(sorted(r['file_path'] for r in results), ['a.py', 'b.py', 'c.py'])
+        for result in results:
+            self.assertIn('suggested_changes', result['analysis'])
+            self.assertNotIn('file_path', result['analysis'])
+
+    def test_find_json_object(self):
+        """Test pulling the analysis object out of the shapes models reply in."""
+        analysis = {'analysis': {'note': 'Use {} and "quotes" \\ here'}, 'suggested_changes': [{'original_code': 'x = {1: 2}'}]}
+        body = orjson.dumps(analysis, option=orjson.OPT_INDENT_2).decode()
+        
+        for response in (
+            body,
+            f"Here is the analysis:\n```json\n{body}\n```\nLet me know if you need more.",
+            f"An unclosed {{ brace and an unrelated {{\"other\": 1}} object come first.\n{body}",
+            f"Several {{ unclosed {{ braces {{ surround it: {body}",
+            f"Note the \"{{\" in your code. Here is the result: {body}",
+            f"Quoted \"}}\" and \"{{\" braces come first.\n```json\n{body}\n```",
+        ):
+            self.assertEqual(_find_json_object(response, 'analysis'), analysis)
+        
+        self.assertIsNone(_find_json_object('{"summary": "no analysis"} and no JSON at all', 'analysis'))
+
+    def test_pack_batches(self):
+        """Test that small files fill the room left beside larger ones."""
+        files = [create_mock_file_content(f'f{size}_{i}.py', size=size) for i, size in enumerate([20, 30, 40, 50, 60, 60, 150])]
+        
+        batches = _pack_batches(files, 100)
+        
+        self.assertEqual(sorted(sum(f.size for f in batch) for batch in batches), [70, 90, 100, 150])
+        self.assertEqual(sorted(f.path for batch in batches for f in batch), sorted(f.path for f in files))
+
+    def test_create_individual_pull_requests(self):
+        """Test creating one pull request per file concurrently."""
+        changes = [{
+            'file_path': f'module_{i}.py',
+            'content': 'def improved_function():\n    pass',
+            'sha': f'base_sha_{i}',
+            'changes_applied': 1,
+            'analysis': {
+                'suggested_changes': [{'explanation': 'Better function name'}],
+                'summary': 'Improved function naming'
+            }
+        } for i in range(3)]
+        
+        mock_pr = MagicMock()
+        mock_pr.html_url = 'https://github.com/user/repo/pull/1'
+        self.mock_repo.create_pull.return_value = mock_pr
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=True
+        )
+        pr_urls = bot.create_individual_pull_requests(changes)
+        
+        self.assertEqual(pr_urls, [mock_pr.html_url] * 3)
+        # The base branch is read once and each file gets its own branch
+        self.mock_repo.get_branch.assert_called_once_with(self.base_branch)
+        created_refs = sorted(c[1]['ref'] for c in self.mock_repo.create_git_ref.call_args_list)
+        self.assertEqual(created_refs, [f"refs/heads/{bot.branch_name}-module_{i}" for i in range(3)])
+        self.assertEqual(self.mock_repo.update_file.call_count, 3)
+        # Files are updated against the blob SHAs recorded by implement_changes
+        self.mock_repo.get_contents.assert_not_called()
+        self.assertEqual(sorted(c[0][3] for c in self.mock_repo.update_file.call_args_list), ['base_sha_0', 'base_sha_1', 'base_sha_2'])
+
+    def test_file_branch_names_are_unique(self):
+        """Files sharing a stem get distinct individual pull request branches."""
+        bot = RepoSage(
+            github_token=self.github_token,
+            repo_name=self.repo_name,
+            openrouter_api_key=self.openrouter_api_key
+        )
+        names = bot._file_branch_names(['pkg/__init__.py', 'lib/__init__.py', 'src/utils.py'])
+
+        self.assertEqual(len(set(names)), 3)
+        self.assertEqual(names[2], f"{bot.branch_name}-utils")
+        self.assertTrue(names[0].startswith(f"{bot.branch_name}-__init__-"))
+        self.assertEqual(names, bot._file_branch_names(['pkg/__init__.py', 'lib/__init__.py', 'src/utils.py']))
 
     @patch('bot.RepoSage.fetch_repo_files')
     @patch('bot.RepoSage.analyze_file')
@@ -428,8 +982,150 @@ class TestRepoSage(unittest.TestCase):
         mock_fetch.assert_called_once()
         self.assertEqual(mock_analyze_file.call_count, len(mock_files))
         self.assertEqual(mock_implement.call_count, len(mock_files))
+        self.mock_repo.create_git_ref.assert_called_once()
         mock_create_pr.assert_called_once()
 
+    @patch('bot.RepoSage.fetch_repo_files')
+    @patch('bot.RepoSage.analyze_file')
+    @patch('bot.RepoSage.implement_changes')
+    @patch('bot.RepoSage.create_pull_request')
+    def test_run_implements_changes_as_analyses_complete(self, mock_create_pr, mock_implement, mock_analyze_file, mock_fetch):
+        """Test that each file's changes are implemented without waiting for the other analyses."""
+        mock_fetch.return_value = [create_mock_file_content(f'test_{i}.py') for i in range(2)]
+        events = []
+        
+        def mock_analyze_side_effect(file_content):
+            events.append(('analyze', file_content.path))
+            return {
+                'file_path': file_content.path,
+                'analysis': {
+                    'suggested_changes': [{'original_code': 'a', 'improved_code': 'b', 'explanation': 'Rename'}],
+                    'summary': 'Renamed'
+                }
+            }
+        
+        def mock_implement_side_effect(file_analysis, dry_run=False):
+            events.append(('implement', file_analysis['file_path']))
+            return dict(file_analysis, content='b', changes_applied=1)
+        
+        mock_analyze_file.side_effect = mock_analyze_side_effect
+        mock_implement.side_effect = mock_implement_side_effect
+        
+        bot = RepoSage(
+            github_token=self.github_token, 
+            repo_name=self.repo_name, 
+            openrouter_api_key=self.openrouter_api_key, 
+            model=self.model, 
+            base_branch=self.base_branch, 
+            use_parallel=False
+        )
+        results = bot.run(direct_commit=False, max_workers=OPENROUTER_POOL_SIZE * 2)
+        
+        # The connection pool grows to one connection per worker
+        self.mock_requests.adapters.HTTPAdapter.assert_called_with(pool_maxsize=OPENROUTER_POOL_SIZE * 2)
+        self.assertEqual(events, [
+            ('analyze', 'test_0.py'), ('implement', 'test_0.py'),
+            ('analyze', 'test_1.py'), ('implement', 'test_1.py')
+        ])
+        self.assertEqual([change['file_path'] for change in results], ['test_0.py', 'test_1.py'])
+
+    @patch('bot.RepoSage.fetch_repo_files')
+    @patch('bot.RepoSage.analyze_file')
+    def test_run_skips_cached_files(self, mock_analyze_file, mock_fetch):
+        """Test that files analyzed in a previous run are not sent to the LLM again."""
+        mock_files = [create_mock_file_content(f'test_{i}.py') for i in range(2)]
+        for i, mock_file in enumerate(mock_files):
+            mock_file.sha = f'sha_{i}'
+        mock_fetch.return_value = mock_files
+        mock_analyze_file.side_effect = lambda file_content: {
+            'file_path': file_content.path,
+            'analysis': {'suggested_changes': [], 'summary': 'No improvements needed'}
+        }
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = os.path.join(temp_dir, 'cache.json')
+            
+            def make_bot(model):
+                return RepoSage(
+                    github_token=self.github_token, 
+                    repo_name=self.repo_name, 
+                    openrouter_api_key=self.openrouter_api_key, 
+                    model=model, 
+                    base_branch=self.base_branch, 
+                    use_parallel=False,
+                    cache_file=cache_file
+                )
+            
+            # A dry run caches nothing
+            make_bot(self.model).run(dry_run=True)
+            make_bot(self.model).run(dry_run=True)
+            self.assertEqual(mock_analyze_file.call_count, 4)
+            
+            # A run that finds nothing to change caches its analyses
+            mock_analyze_file.reset_mock()
+            make_bot(self.model).run()
+            self.assertEqual(mock_analyze_file.call_count, 2)
+            
+            # Second run with unchanged blobs skips both files
+            mock_analyze_file.reset_mock()
+            make_bot(self.model).run()
+            mock_analyze_file.assert_not_called()
+            
+            # A changed blob or a different model invalidates the cached analysis
+            mock_files[0].sha = 'sha_0_changed'
+            make_bot(self.model).run()
+            self.assertEqual(mock_analyze_file.call_count, 1)
+            
+            mock_analyze_file.reset_mock()
+            make_bot('another/model').run()
+            self.assertEqual(mock_analyze_file.call_count, 2)
+            
+            # So does a change to the prompts
+            mock_analyze_file.reset_mock()
+            with patch('bot.PROMPT_VERSION', 'new-prompt'):
+                make_bot('another/model').run()
+            self.assertEqual(mock_analyze_file.call_count, 2)
+
+    @patch('bot.RepoSage.fetch_repo_files')
+    @patch('bot.RepoSage.analyze_file')
+    @patch('bot.RepoSage.implement_changes')
+    @patch('bot.RepoSage.update_changelog')
+    @patch('bot.RepoSage.commit_changes_directly')
+    def test_run_caches_changes_once_committed(self, mock_commit, mock_changelog, mock_implement, mock_analyze_file, mock_fetch):
+        """Test that analyses with changes are cached only after the changes are committed."""
+        mock_file = create_mock_file_content('test.py')
+        mock_file.sha = 'sha_0'
+        mock_fetch.return_value = [mock_file]
+        mock_analyze_file.return_value = {
+            'file_path': 'test.py',
+            'analysis': {'suggested_changes': [{'explanation': 'Better name'}], 'summary': 'Improved naming'}
+        }
+        mock_implement.return_value = {'file_path': 'test.py', 'content': 'pass', 'changes_applied': 1}
+        mock_changelog.return_value = (True, "Changelog updated")
+        
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache_file = os.path.join(temp_dir, 'cache.json')
+            
+            def run():
+                RepoSage(
+                    github_token=self.github_token,
+                    repo_name=self.repo_name,
+                    openrouter_api_key=self.openrouter_api_key,
+                    use_parallel=False,
+                    cache_file=cache_file
+                ).run()
+            
+            # Failed tests abort the commit, so the file is analyzed again
+            mock_commit.return_value = (False, "Tests failed")
+            run()
+            run()
+            self.assertEqual(mock_analyze_file.call_count, 2)
+            
+            mock_commit.return_value = (True, "Committed")
+            run()
+            run()
+            self.assertEqual(mock_analyze_file.call_count, 3)
+
     def test_implement_tests(self):
         """Test the implement_tests method"""
         # Mock suggested changes with test code
@@ -480,6 +1176,30 @@ class TestRepoSage(unittest.TestCase):
         # Check that the tests failed
         self.assertFalse(success)
         self.assertEqual(output, "Test failed\nError in test")
+    
+    @patch('bot.subprocess.run')
+    def test_run_tests_reuses_working_tree(self, mock_run):
+        """Test that the repository is cloned once and the changes are tested."""
+        mock_run.return_value = MagicMock(returncode=0, stdout="1 passed", stderr="")
+        
+        success, output = self.bot.run_tests(files={'pkg/module.py': 'def improved_function():\n    pass\n'})
+        self.assertTrue(success)
+        self.assertEqual(output, "1 passed")
+        test_dir = self.bot._test_dir
+        self.assertEqual(Path(test_dir, 'pkg', 'module.py').read_text(), 'def improved_function():\n    pass\n')
+        
+        # The second run resets the existing tree instead of cloning again,
+        # and reuses the test command detected by the first
+        with patch.object(self.bot, '_detect_test_command') as mock_detect:
+            success, _ = self.bot.run_tests()
+        self.assertTrue(success)
+        mock_detect.assert_not_called()
+        commands = [c[0][0] for c in mock_run.call_args_list]
+        self.assertEqual(len([command for command in commands if command[:2] == ["git", "clone"]]), 1)
+        self.assertIn(["git", "-C", test_dir, "reset", "--hard", "FETCH_HEAD"], commands)
+        
+        self.bot.close()
+        self.assertFalse(os.path.exists(test_dir))
         
     def test_changelog_functionality(self):
         """Test the changelog functionality"""
@@ -509,7 +1229,14 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
             self.assertIn("# Changelog", changelog_content)
             self.assertIn("## [Unreleased]", changelog_content)
         
-        # Test creating a changelog when it doesn't exist
+        # Subsequent reads are served from the cached changelog
+        with patch.object(self.bot.repo, 'get_contents') as mock_get_contents:
+            self.assertEqual(self.bot.read_changelog(), changelog_content)
+            mock_get_contents.assert_not_called()
+        
+        # Test creating a changelog when it doesn't exist, starting from a fresh bot state
+        self.bot._changelog_content = None
+        self.bot._contents_cache.clear()
         with patch.object(self.bot.repo, 'get_contents', side_effect=Exception("File not found")):
             with patch.object(self.bot.repo, 'create_file', return_value=None) as mock_create:
                 # Set direct_commit for proper branch selection
@@ -547,5 +1274,104 @@ and this project adheres to [Semantic Versioning](https://semver.org/spec/v2.0.0
                     updated_content = mock_update.call_args[0][2]
                     self.assertIn("test.py: Better function name", updated_content)
 
+    def test_changelog_created_after_branch(self):
+        """Test that a missing changelog is only created on the feature branch once the branch exists."""
+        branch_future = concurrent.futures.Future()
+        self.bot.direct_commit = False
+        self.bot._branch_future = branch_future
+        with patch.object(self.bot.repo, 'get_contents', side_effect=Exception("File not found")):
+            with patch.object(self.bot.repo, 'create_file', return_value=None) as mock_create:
+                with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                    changelog_future = executor.submit(self.bot.read_changelog)
+                    with self.assertRaises(concurrent.futures.TimeoutError):
+                        changelog_future.result(timeout=0.1)
+                    mock_create.assert_not_called()
+
+                    branch_future.set_result(True)
+                    self.assertIn("# Changelog", changelog_future.result(timeout=5))
+                mock_create.assert_called_once_with("CHANGELOG.md", ANY, ANY, branch=self.bot.branch_name)
+
+    def test_categorize_explanation(self):
+        """Test the keyword classification of changelog entries."""
+        self.assertEqual(_categorize_explanation("Fix crash on empty input"), "fixed")
+        # Fix keywords take precedence regardless of their position
+        self.assertEqual(_categorize_explanation("Add handling for the ERROR case"), "fixed")
+        self.assertEqual(_categorize_explanation("Implement caching"), "added")
+        self.assertEqual(_categorize_explanation("Better function name"), "changed")
+
+    def test_should_analyze_file_ignored_directories(self):
+        """Test that only whole ignored directory names exclude a path."""
+        for path, expected in [
+            ('src/app.py', True),
+            ('node_modules/lib/index.js', False),
+            ('packages/web/dist/bundle.js', False),
+            ('src/rebuild.py', True),
+            ('distance.py', True),
+            ('.github/workflows/ci.yml', True),
+            ('.git/config.yml', False)
+        ]:
+            self.assertEqual(self.bot.should_analyze_file(create_mock_file_content(path)), expected, path)
+
+    def test_apply_changes(self):
+        """Test applying suggested changes in a single pass."""
+        content = "x = 1\ny = x + 1\nx = 1\n"
+        changes = [
+            {'original_code': 'x = 1', 'improved_code': 'x = 2'},
+            {'original_code': 'y = x + 1', 'improved_code': 'y = x + 2'},
+            {'original_code': 'missing', 'improved_code': 'ignored'},
+            {'original_code': '', 'improved_code': 'never inserted'},
+            {'explanation': 'No code given'}
+        ]
+        new_content, applied = _apply_changes(content, changes)
+        self.assertEqual(new_content, "x = 2\ny = x + 2\nx = 2\n")
+        self.assertEqual(applied, 2)
+        
+        # Replacements apply to the original text, not to earlier replacements
+        new_content, applied = _apply_changes("a", [
+            {'original_code': 'a', 'improved_code': 'b'},
+            {'original_code': 'b', 'improved_code': 'c'}
+        ])
+        self.assertEqual((new_content, applied), ("b", 1))
+        
+        # A line range picks out one occurrence of a repeated snippet
+        new_content, applied = _apply_changes(content, [
+            {'original_code': 'x = 1', 'improved_code': 'x = 3', 'line_range': [3, 3]}
+        ])
+        self.assertEqual((new_content, applied), ("x = 1\ny = x + 1\nx = 3\n", 1))
+        
+        # A range that is out of bounds or misses the snippet falls back to replacing every occurrence
+        new_content, applied = _apply_changes(content, [
+            {'original_code': 'x = 1', 'improved_code': 'x = 3', 'line_range': [2, 2]},
+            {'original_code': 'y = x + 1', 'improved_code': 'y = x', 'line_range': [2, 9]}
+        ])
+        self.assertEqual((new_content, applied), ("x = 3\ny = x\nx = 3\n", 2))
+        
+        # Snippets that differ from the file only in whitespace still apply
+        new_content, applied = _apply_changes("def f(a,  b):\n    return a+b\n\nx = 1\n", [
+            {'original_code': 'def f(a, b):\n  return a+b\n', 'improved_code': 'def f(a, b):\n    return a + b\n'},
+            {'original_code': ' \n ', 'improved_code': 'never inserted'}
+        ])
+        self.assertEqual((new_content, applied), ("def f(a, b):\n    return a + b\n\nx = 1\n", 1))
+
+        # Improved code keeps the indentation of the nested block it replaces
+        content = "class A:\n    def f(self):\n        if x:\n            y()\n"
+        for original, improved in [
+            ("  if x:\n      y()\n", "  if x:\n      z()\n  w()\n"),
+            ("if  x:\n    y()", "if x:\n    z()\nw()"),
+        ]:
+            with self.subTest(original=original):
+                new_content, applied = _apply_changes(content, [
+                    {'original_code': original, 'improved_code': improved}
+                ])
+                self.assertEqual(applied, 1)
+                self.assertEqual(new_content.rstrip("\n"), "class A:\n    def f(self):\n        if x:\n            z()\n        w()")
+
+    def test_code_fence(self):
+        """Test that the prompt fence is longer than any backtick run in the content."""
+        self.assertEqual(_code_fence("def f():\n    return 'x'"), "```")
+        self.assertEqual(_code_fence("Use `x` here"), "```")
+        self.assertEqual(_code_fence("```python\nprint(1)\n```"), "````")
+        self.assertEqual(_code_fence("`````"), "``````")
+
 if __name__ == '__main__':
     unittest.main()
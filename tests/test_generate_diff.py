@@ -0,0 +1,78 @@
+import sys
+import os.path
+import unittest
+
+# Add the repo-sage-action directory to the Python path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'repo-sage-action')))
+
+from generate_diff import COLOR_RESET, DIFF_COLORS, HEADER_COLOR, colorize_diff_lines, generate_diff
+
+ADDED_COLOR = dict(DIFF_COLORS)['+']
+REMOVED_COLOR = dict(DIFF_COLORS)['-']
+HUNK_COLOR = dict(DIFF_COLORS)['@@']
+
+
+class TestGenerateDiff(unittest.TestCase):
+    """Test suite for the diff preview."""
+
+    def test_colorize_diff_lines(self):
+        """Test that headers, hunks and changed lines get git's colors."""
+        lines = [
+            "--- a/x.py",
+            "+++ b/x.py",
+            "@@ -1,2 +1,2 @@",
+            " context",
+            "--- removed line that looks like a header",
+            "+++ added line that looks like a header",
+            "-removed",
+            "+added",
+            "\\ No newline at end of file",
+        ]
+
+        self.assertEqual(list(colorize_diff_lines(lines)), [
+            f"{HEADER_COLOR}--- a/x.py{COLOR_RESET}",
+            f"{HEADER_COLOR}+++ b/x.py{COLOR_RESET}",
+            f"{HUNK_COLOR}@@ -1,2 +1,2 @@{COLOR_RESET}",
+            " context",
+            f"{REMOVED_COLOR}--- removed line that looks like a header{COLOR_RESET}",
+            f"{ADDED_COLOR}+++ added line that looks like a header{COLOR_RESET}",
+            f"{REMOVED_COLOR}-removed{COLOR_RESET}",
+            f"{ADDED_COLOR}+added{COLOR_RESET}",
+            "\\ No newline at end of file",
+        ])
+
+    def test_generate_diff(self):
+        """Test the unified diff between two versions of a file."""
+        self.assertEqual(generate_diff("a\n", "a\n", "x.py"), "No changes for x.py")
+
+        self.assertEqual(generate_diff("a\nb\n", "a\nc\n", "x.py"), "\n".join([
+            f"{HEADER_COLOR}--- a/x.py{COLOR_RESET}",
+            f"{HEADER_COLOR}+++ b/x.py{COLOR_RESET}",
+            f"{HUNK_COLOR}@@ -1,2 +1,2 @@{COLOR_RESET}",
+            " a",
+            f"{REMOVED_COLOR}-b{COLOR_RESET}",
+            f"{ADDED_COLOR}+c{COLOR_RESET}",
+        ]))
+
+    def test_generate_diff_end_of_file_newline(self):
+        """Test that adding or removing only the final newline shows up in the diff."""
+        hunk = [
+            f"{HEADER_COLOR}--- a/x.py{COLOR_RESET}",
+            f"{HEADER_COLOR}+++ b/x.py{COLOR_RESET}",
+            f"{HUNK_COLOR}@@ -1,2 +1,2 @@{COLOR_RESET}",
+            " a",
+        ]
+
+        self.assertEqual(generate_diff("a\nb", "a\nb\n", "x.py"), "\n".join(hunk + [
+            f"{REMOVED_COLOR}-b{COLOR_RESET}",
+            "\\ No newline at end of file",
+            f"{ADDED_COLOR}+b{COLOR_RESET}",
+        ]))
+        self.assertEqual(generate_diff("a\nb\n", "a\nb", "x.py"), "\n".join(hunk + [
+            f"{REMOVED_COLOR}-b{COLOR_RESET}",
+            f"{ADDED_COLOR}+b{COLOR_RESET}",
+            "\\ No newline at end of file",
+        ]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,7 +4,7 @@ Contains common mock functions and classes used in both unit and integration tes
 """
 
 import base64
-import json
+import orjson
 from unittest.mock import MagicMock, PropertyMock
 from pathlib import Path
 
@@ -13,7 +13,8 @@ class MockResponse:
     def __init__(self, status_code, json_data):
         self.status_code = status_code
         self._json_data = json_data
-        self.text = json.dumps(json_data)
+        self.content = orjson.dumps(json_data)
+        self.text = self.content.decode('utf-8')
     
     def json(self):
         return self._json_data
@@ -24,6 +25,7 @@ def create_mock_file_content(path, content=None, size=100):
     mock_file.path = path
     mock_file.type = "file"
     mock_file.size = size
+    mock_file.mode = "100644"
     
     if content is None:
         default_content = f"def old_function():\n    pass"
@@ -33,6 +35,13 @@ def create_mock_file_content(path, content=None, size=100):
     
     return mock_file
 
+def message_text(message):
+    """Return the full text of a chat message, joining its content parts."""
+    content = message['content']
+    if isinstance(content, str):
+        return content
+    return "".join(part['text'] for part in content)
+
 def create_mock_file_from_path(file_path, sha=None):
     """
     Create a mock file content object from an actual file path.
@@ -59,7 +68,7 @@ def mock_openrouter_response(success=True, with_changes=True):
     
     if success:
         if with_changes:
-            mock_response.json.return_value = {
+            response_data = {
                 'choices': [{
                     'message': {
                         'content': '''{
@@ -81,7 +90,7 @@ def mock_openrouter_response(success=True, with_changes=True):
                 }]
             }
         else:
-            mock_response.json.return_value = {
+            response_data = {
                 'choices': [{
                     'message': {
                         'content': '''{
@@ -97,6 +106,7 @@ def mock_openrouter_response(success=True, with_changes=True):
                     }
                 }]
             }
+        mock_response.content = orjson.dumps(response_data)
     else:
         mock_response.status_code = 400
         mock_response.text = "Bad request"